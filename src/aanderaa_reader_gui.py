@@ -8,7 +8,7 @@ import time
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 import tkinter as tk
 from tkinter import ttk, messagebox
@@ -23,13 +23,30 @@ from matplotlib.figure import Figure
 import matplotlib.dates as mdates
 
 from aanderaa_sensor_reader_custom import AanderaaSensorCustom, SensorEvent, _reader_loop
-from config_manager import load_sensors, save_sensors_to_user_config, load_state, save_state
+from config_manager import infer_sensor_type, load_sensors, save_sensors_to_user_config, load_state, save_state
 from configure_streaming_mode import SensorTerminalSession
-from set_interval import configure_sensor_interval
+from identify_sensors import filter_candidate_ports
+from serial_io import run_per_port
+from set_interval import configure_sensor_interval, wait_for_boot
 
 
 _FLOAT_RE = re.compile(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?")
 
+_comports_cache: Optional[Tuple[float, list]] = None
+
+
+def _comports(max_age: float = 5.0) -> list:
+    """Enumerate serial ports, reusing the previous result for up to ``max_age`` seconds.
+
+    comports() walks the OS device tree, which can take seconds on Windows machines with
+    Bluetooth COM ports; a single Scan + Identify used to do it three times.
+    """
+    global _comports_cache
+    now = time.monotonic()
+    if _comports_cache is None or now - _comports_cache[0] >= max_age:
+        _comports_cache = (now, list(serial.tools.list_ports.comports()))
+    return list(_comports_cache[1])
+
 
 def _o2_umol_l_to_mg_l(o2_umol_l: float) -> float:
     """Convert dissolved O2 from µmol/L to mg/L.
@@ -206,17 +223,6 @@ def _primary_key_for(sensor_type: str) -> str:
     return "Value1"
 
 
-def _infer_sensor_type_from_product(product: str) -> str:
-    p = (product or "").upper()
-    if p.startswith("4117") or p.startswith("5217") or p.startswith("5218"):
-        return "pressure"
-    if p.startswith("4330") or p.startswith("4835") or p.startswith("4831"):
-        return "oxygen"
-    if p.startswith("5819") or p.startswith("5990"):
-        return "conductivity"
-    return "unknown"
-
-
 @dataclass
 class Series:
     t: List[datetime]
@@ -699,12 +705,13 @@ class AanderaaGUI(tk.Tk):
         self._refresh_com_choices()
 
     def _refresh_com_choices(self) -> None:
-        ports = [p.device for p in serial.tools.list_ports.comports()]
+        ports = [p.device for p in _comports()]
         self._com_box.configure(values=ports)
 
     def _scan_and_identify(self) -> None:
+        # An explicit Scan always re-enumerates (the user may just have plugged something in).
+        ports = _comports(max_age=0.0)
         self._refresh_com_choices()
-        ports = list(serial.tools.list_ports.comports())
         if not ports:
             messagebox.showwarning("No ports", "No COM ports found.")
             return
@@ -725,36 +732,58 @@ class AanderaaGUI(tk.Tk):
         t = threading.Thread(target=self._identify_worker, daemon=True)
         t.start()
 
-    def _identify_worker(self) -> None:
-        ports = [p.device for p in serial.tools.list_ports.comports()]
-        detected: List[AanderaaSensorCustom] = []
+    @staticmethod
+    def _identify_port(port: str, log: Callable[[str], None]) -> Optional[AanderaaSensorCustom]:
+        s = AanderaaSensorCustom(com_port=port, name="Unknown", sensor_type="unknown", log=log)
+        try:
+            ok = s.connect()
+            if not ok:
+                return None
 
-        for port in ports:
-            if len(detected) >= 3:
-                break
+            # Give it a bit of time to emit a valid frame
+            for _ in range(5):
+                if s.product_number and s.serial_number:
+                    break
+                _ = s.get_measurement()
+                time.sleep(0.3)
 
-            s = AanderaaSensorCustom(com_port=port, name="Unknown", sensor_type="unknown")
+            if s.product_number and s.serial_number:
+                return s
+        except Exception:
+            pass
+        finally:
             try:
-                ok = s.connect()
-                if not ok:
-                    continue
-
-                # Give it a bit of time to emit a valid frame
-                for _ in range(5):
-                    if s.product_number and s.serial_number:
-                        break
-                    _ = s.get_measurement()
-                    time.sleep(0.3)
-
-                if s.product_number and s.serial_number:
-                    detected.append(s)
+                s.disconnect()
             except Exception:
                 pass
-            finally:
-                try:
-                    s.disconnect()
-                except Exception:
-                    pass
+        return None
+
+    def _identify_worker(self) -> None:
+        # Skip Bluetooth/modem ports when known USB-serial adapters are present.
+        ports = [p.device for p in filter_candidate_ports(_comports())]
+        detected: List[AanderaaSensorCustom] = []
+        max_sensors = 3
+        enough = threading.Event()
+        hits_lock = threading.Lock()
+        hits = 0
+
+        def probe(port: str, log: Callable[[str], None]) -> Optional[AanderaaSensorCustom]:
+            nonlocal hits
+            # Ports still waiting for a worker are skipped once enough sensors were found
+            if enough.is_set():
+                return None
+            s = self._identify_port(port, log)
+            if s is not None:
+                with hits_lock:
+                    hits += 1
+                    if hits >= max_sensors:
+                        enough.set()
+            return s
+
+        # Every port is a separate device, so probe a few at once; keep port order.
+        if ports:
+            found = run_per_port(ports, probe, max_workers=min(len(ports), 4))
+            detected = [s for s in found if s is not None][:max_sensors]
 
         self.after(0, lambda: self._apply_detected(detected))
 
@@ -768,7 +797,7 @@ class AanderaaGUI(tk.Tk):
         for s in detected:
             product = s.product_number or ""
             serial_no = s.serial_number or ""
-            sensor_type = s.sensor_type or _infer_sensor_type_from_product(product)
+            sensor_type = s.sensor_type or infer_sensor_type(product)
             name = s.name or "Unknown"
             self._tree.insert("", "end", values=(name, s.com_port, sensor_type, product, serial_no))
 
@@ -861,8 +890,8 @@ class AanderaaGUI(tk.Tk):
                         ok = configure_sensor_interval(com_port, interval_s, do_reset=True, force_terminal_mode=False)
                         if not ok:
                             print(f"[{com_port}] Warning: interval configuration may not have applied")
-                        # After Reset, give the sensor time to reboot.
-                        time.sleep(6.0)
+                        # After Reset, wait until the sensor answers again (at most 6 s).
+                        wait_for_boot(com_port, max_wait=6.0)
                 except Exception as e:
                     print(f"[{com_port}] Warning: interval configuration error: {e}")
 
@@ -1070,13 +1099,10 @@ class AanderaaGUI(tk.Tk):
             ser.reset_input_buffer()
             time.sleep(0.5)
             
-            # Test if we can get a command response
+            # Test if we can get a command response; Get replies end with the '#' prompt,
+            # so read_until returns as soon as it arrives (ser.timeout bounds the wait)
             ser.write(b'$GET ProductName\r\n')
-            time.sleep(1.0)
-            
-            response = ""
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+            response = ser.read_until(b'#', 4096).decode('ascii', errors='ignore')
             
             ser.close()
             
@@ -1423,7 +1449,7 @@ class AanderaaGUI(tk.Tk):
             if str(vals[1]).upper() != str(ev.com_port).upper():
                 continue
             vals[0] = ev.name
-            detected_type = _infer_sensor_type_from_product(str(ev.measurements.get("ProductNumber", "")))
+            detected_type = infer_sensor_type(str(ev.measurements.get("ProductNumber", "")))
             if detected_type != "unknown":
                 vals[2] = detected_type
             vals[3] = ev.measurements.get("ProductNumber", vals[3])
@@ -4,6 +4,7 @@ Communicates with multiple Aanderaa sensors via RS-232/COM ports
 Supports: Pressure Sensor 4117B, Oxygen Optode 4330, Conductivity Sensor 5819
 """
 
+import re
 import serial
 import time
 from typing import Dict, Optional, List
@@ -17,6 +18,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Value after the first '=' in a GET reply, and every key=value line of a DO reply
+_VALUE_RE = re.compile(r'=([^\n]*)')
+_KEY_VALUE_RE = re.compile(r'^([^=\n]*)=([^\n]*)', re.M)
+
 
 @dataclass
 class SensorConfig:
@@ -101,7 +106,7 @@ class AanderaaSensor:
             # Send command
             cmd = command + '\r\n'
             self.serial_port.write(cmd.encode('ascii'))
-            logger.debug(f"Sent to {self.config.name}: {command}")
+            logger.debug("Sent to %s: %s", self.config.name, command)
             
             # Wait longer for sensor to process command
             time.sleep(1.0)
@@ -120,7 +125,7 @@ class AanderaaSensor:
                     time.sleep(0.2)
                 attempts += 1
             
-            logger.debug(f"Received from {self.config.name}: {response}")
+            logger.debug("Received from %s: %s", self.config.name, response)
             return response.strip()
             
         except Exception as e:
@@ -163,22 +168,16 @@ class AanderaaSensor:
     def parse_response(self, response: str) -> str:
         """Parse GET command response"""
         # Response format: RESULT GET PropertyName=Value
-        lines = response.split('\n')
-        for line in lines:
-            if '=' in line:
-                return line.split('=', 1)[1].strip()
+        match = _VALUE_RE.search(response)
+        if match:
+            return match.group(1).strip()
         return response.strip()
     
     def parse_measurement(self, response: str) -> Dict[str, str]:
         """Parse measurement response"""
         measurements = {}
-        lines = response.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if '=' in line:
-                key, value = line.split('=', 1)
-                measurements[key.strip()] = value.strip()
+        for key, value in _KEY_VALUE_RE.findall(response):
+            measurements[key.strip()] = value.strip()
         
         return measurements
     
@@ -7,37 +7,24 @@ import time
 import json
 from datetime import datetime
 from pathlib import Path
-import re
-from typing import Optional, List, Dict
+from typing import Callable, Optional, List, Dict
 import threading
 import queue
 from dataclasses import dataclass
 
-from config_manager import resolve_config_path
+from config_manager import infer_sensor_type, resolve_config_path
 
 
-_CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+# One translate() pass: drop ASCII control chars (except tab/LF/CR) and the '!' ready marker,
+# and turn CR into LF so frames split on a single separator
+_FRAME_CLEAN = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), ord("!")])
+_FRAME_CLEAN[ord("\r")] = ord("\n")
 
 
-def _strip_control_chars(s: str) -> str:
-    # Keep tab/newline/carriage return; drop other ASCII control chars.
-    return _CONTROL_CHARS_RE.sub("", s)
-
-
-def _infer_sensor_type(product: str) -> str:
-    p = (product or "").upper()
-    if p.startswith("4117") or p.startswith("5217") or p.startswith("5218"):
-        return "pressure"
-    if p.startswith("4330") or p.startswith("4835") or p.startswith("4831"):
-        return "oxygen"
-    if p.startswith("5819") or p.startswith("5990"):
-        return "conductivity"
-    return "unknown"
-
 class AanderaaSensorCustom:
     """Handler for Aanderaa sensors using custom tab-delimited protocol"""
     
-    def __init__(self, com_port, name="Unknown", sensor_type=""):
+    def __init__(self, com_port, name="Unknown", sensor_type="", log: Callable[[str], None] = print):
         self.com_port = com_port
         self.name = name
         self.sensor_type = sensor_type
@@ -48,6 +35,8 @@ class AanderaaSensorCustom:
         self.protocol_mode = "unknown"  # 'tab', 'terminal', 'unknown'
         self.last_measurement: Dict[str, str] = {}
         self.last_measurement_time: Optional[datetime] = None
+        # Progress messages from connect()/get_measurement(); callers probing many ports buffer them per port
+        self._log = log
 
     def parse_tab_frame(self, data_frame: List[str]) -> Dict[str, str]:
         """Convert a tab-delimited frame fields list into a measurement dict."""
@@ -58,7 +47,7 @@ class AanderaaSensorCustom:
         serial_no = data_frame[1]
         values = data_frame[2:]
 
-        inferred = _infer_sensor_type(product)
+        inferred = infer_sensor_type(product)
         if inferred != "unknown" and self.sensor_type != inferred:
             self.sensor_type = inferred
 
@@ -97,8 +86,11 @@ class AanderaaSensorCustom:
         self.last_measurement_time = datetime.now()
         return measurements
 
-    def _read_for(self, duration_s: float) -> str:
-        """Read whatever the sensor emits for a short duration."""
+    def _read_for(self, duration_s: float, until: Optional[Callable[[str], bool]] = None) -> str:
+        """Read whatever the sensor emits for a short duration.
+
+        If ``until`` is given, stop as soon as it returns True for the text read so far.
+        """
         if not self.serial_port:
             return ""
 
@@ -108,19 +100,25 @@ class AanderaaSensorCustom:
             waiting = self.serial_port.in_waiting
             if waiting > 0:
                 chunks.append(self.serial_port.read(waiting).decode("ascii", errors="ignore"))
+                if until is not None and until("".join(chunks)):
+                    break
                 # small sleep to allow framing
                 time.sleep(0.05)
             else:
                 time.sleep(0.05)
         return "".join(chunks)
 
+    def _has_data_frame(self, raw: str) -> bool:
+        # Only count finished lines so an early stop never cuts a frame in half.
+        complete = raw[: max(raw.rfind("\n"), raw.rfind("\r")) + 1]
+        return self._pick_best_data_frame(self._extract_tab_frames(complete)) is not None
+
     def _extract_tab_frames(self, raw: str) -> List[List[str]]:
         """Return list of tab-delimited frames (fields list)."""
         if not raw:
             return []
-        text = _strip_control_chars(raw).replace("!", "")
         frames: List[List[str]] = []
-        for line in text.replace("\r", "\n").split("\n"):
+        for line in raw.translate(_FRAME_CLEAN).split("\n"):
             if "\t" not in line:
                 continue
             fields = [f.strip() for f in line.split("\t") if f.strip() != ""]
@@ -129,10 +127,9 @@ class AanderaaSensorCustom:
             frames.append(fields)
         return frames
 
-    def _pick_best_data_frame(self, frames: List[List[str]]) -> Optional[List[str]]:
-        """Prefer non-error frames that look like '<product> <serial> <values...>'."""
-        best = None
-        for fields in frames:
+    def _pick_best_data_frame(self, frames: List[List[str]], prefer_last: bool = False) -> Optional[List[str]]:
+        """Return the first (or, with prefer_last, the newest) non-error frame that looks like '<product> <serial> <values...>'."""
+        for fields in (reversed(frames) if prefer_last else frames):
             if len(fields) < 2:
                 continue
             # Typical error: '*\tERROR\tSYNTAX ERROR'
@@ -142,19 +139,19 @@ class AanderaaSensorCustom:
             product = fields[0]
             serial = fields[1]
             # Heuristic: product often starts with 4 digits
-            if not re.match(r"^\d{4}.*", product):
+            if len(product) < 4 or not product[:4].isdigit():
                 continue
-            if not re.match(r"^\d+", serial):
+            if not serial[:1].isdigit():
                 # Some devices might include non-numeric serial; still accept if we have values
                 if len(fields) < 3:
                     continue
-            best = fields
-        return best
+            return fields
+        return None
     
     def connect(self):
         """Connect to sensor"""
         try:
-            print(f"  Attempting to open {self.com_port}...")
+            self._log(f"  Attempting to open {self.com_port}...")
             self.serial_port = serial.Serial(
                 port=self.com_port,
                 baudrate=9600,
@@ -170,14 +167,14 @@ class AanderaaSensorCustom:
                 dsrdtr=False
             )
             
-            print(f"  Port {self.com_port} opened, clearing buffers...")
+            self._log(f"  Port {self.com_port} opened, clearing buffers...")
             # Clear buffers
             self.serial_port.reset_input_buffer()
             self.serial_port.reset_output_buffer()
             time.sleep(0.3)
             
             # Send wake-up
-            print(f"  Sending wake-up to {self.com_port}...")
+            self._log(f"  Sending wake-up to {self.com_port}...")
             # Wake sequence: CR/LF + '%' (common for Aanderaa sleep wake).
             for _ in range(3):
                 self.serial_port.write(b"\r\n")
@@ -185,19 +182,23 @@ class AanderaaSensorCustom:
             # ';' is used by SensorTerminalSession and is generally safe as a wake character.
             self.serial_port.write(b";")
 
-            wake_resp = self._read_for(1.2)
+            # Each listen window ends as soon as a complete data frame has arrived.
+            wake_resp = self._read_for(1.2, until=self._has_data_frame)
             if wake_resp:
-                print(f"  Wake response: {repr(wake_resp)}")
+                self._log(f"  Wake response: {repr(wake_resp)}")
 
-            # PROBE 1: passively listen for a tab-delimited data frame.
-            probe = self._read_for(1.5)
+            # PROBE 1: passively listen for a tab-delimited data frame
+            # (a streaming sensor may already have sent one during the wake window).
+            probe = wake_resp
+            if not self._has_data_frame(probe):
+                probe = self._read_for(1.5, until=self._has_data_frame)
             frames = self._extract_tab_frames(probe)
             data_frame = self._pick_best_data_frame(frames)
 
             # PROBE 2: if nothing yet, send a harmless newline (some setups only emit after a trigger)
             if not data_frame:
                 self.serial_port.write(b"\r\n")
-                probe2 = self._read_for(1.5)
+                probe2 = self._read_for(1.5, until=self._has_data_frame)
                 frames2 = self._extract_tab_frames(probe2)
                 data_frame = self._pick_best_data_frame(frames2)
 
@@ -209,14 +210,14 @@ class AanderaaSensorCustom:
                 self.protocol_mode = "tab"
                 self.product_number = data_frame[0]
                 self.serial_number = data_frame[1]
-                inferred = _infer_sensor_type(self.product_number)
+                inferred = infer_sensor_type(self.product_number)
                 if inferred != "unknown" and self.sensor_type and self.sensor_type != "unknown" and self.sensor_type != inferred:
-                    print(f"  ℹ Detected product {self.product_number}; overriding configured sensor_type '{self.sensor_type}' -> '{inferred}'")
+                    self._log(f"  ℹ Detected product {self.product_number}; overriding configured sensor_type '{self.sensor_type}' -> '{inferred}'")
                 if inferred != "unknown":
                     self.sensor_type = inferred
                 self.name = f"Sensor {self.product_number} SN {self.serial_number}"
                 self.is_connected = True
-                print(f"✓ Connected to {self.name} on {self.com_port} ({self.protocol_mode} mode)")
+                self._log(f"✓ Connected to {self.name} on {self.com_port} ({self.protocol_mode} mode)")
                 return True
 
             # If we got *any* response at all (wake / error), keep it as a soft-connect
@@ -224,15 +225,15 @@ class AanderaaSensorCustom:
             if wake_resp:
                 self.protocol_mode = "unknown"
                 self.is_connected = True
-                print(f"✓ Port responsive on {self.com_port}, awaiting first data frame...")
+                self._log(f"✓ Port responsive on {self.com_port}, awaiting first data frame...")
                 return True
 
-            print(f"✗ No usable response/data from {self.com_port}")
+            self._log(f"✗ No usable response/data from {self.com_port}")
             self.serial_port.close()
             return False
             
         except Exception as e:
-            print(f"✗ Error connecting to {self.com_port}: {e}")
+            self._log(f"✗ Error connecting to {self.com_port}: {e}")
             return False
     
     def get_measurement(self):
@@ -255,17 +256,17 @@ class AanderaaSensorCustom:
             
             # Debug output
             if response:
-                print(f"  [DEBUG] Raw response: {repr(response)}")
+                self._log(f"  [DEBUG] Raw response: {repr(response)}")
 
             frames = self._extract_tab_frames(response)
-            data_frame = self._pick_best_data_frame(frames)
+            data_frame = self._pick_best_data_frame(frames, prefer_last=True)
             if not data_frame:
                 return {}
 
             return self.parse_tab_frame(data_frame)
             
         except Exception as e:
-            print(f"✗ Error reading from {self.name}: {e}")
+            self._log(f"✗ Error reading from {self.name}: {e}")
             return {}
     
     def disconnect(self):
@@ -336,7 +337,7 @@ def _reader_loop(sensor: AanderaaSensorCustom, out_queue: "queue.Queue[SensorEve
                     last_debug = time.time()
                 if "\t" in buffer and len(buffer) > 20:
                     frames = sensor._extract_tab_frames(buffer)
-                    data_frame = sensor._pick_best_data_frame(frames)
+                    data_frame = sensor._pick_best_data_frame(frames, prefer_last=True)
                     if data_frame:
                         measurements = sensor.parse_tab_frame(data_frame)
                         if measurements:
@@ -400,7 +401,7 @@ def load_config(config_path="sensor_config.json"):
 
 
 def _suggest_name(product: str, serial_no: str) -> str:
-    inferred = _infer_sensor_type(product)
+    inferred = infer_sensor_type(product)
     if inferred == "oxygen":
         return f"Oxygen Optode {product} SN {serial_no}"
     if inferred == "conductivity":
@@ -425,7 +426,7 @@ def print_suggested_config(sensors: List[AanderaaSensorCustom], config_path: Pat
                 "name": _suggest_name(s.product_number, s.serial_number),
                 "com_port": s.com_port,
                 "baudrate": 9600,
-                "sensor_type": _infer_sensor_type(s.product_number),
+                "sensor_type": infer_sensor_type(s.product_number),
                 "timeout": 5,
             }
             for s in detected
@@ -462,7 +463,7 @@ def prime_identification(sensors: List[AanderaaSensorCustom], max_wait_s: float
             serial_no = data_frame[1]
             s.product_number = product
             s.serial_number = serial_no
-            inferred = _infer_sensor_type(product)
+            inferred = infer_sensor_type(product)
             if inferred != "unknown":
                 s.sensor_type = inferred
             s.name = f"Sensor {product} SN {serial_no}"
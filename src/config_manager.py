@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 import json
+import re
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional
@@ -10,6 +11,23 @@ from typing import Any, Dict, List, Optional
 APP_NAME = "anderaa_reader"
 CONFIG_FILE_NAME = "sensor_config.json"
 STATE_FILE_NAME = "app_state.json"
+DETECTION_CACHE_FILE_NAME = "detection_cache.json"
+
+# Aanderaa product number -> sensor_type used in sensor_config.json. The number
+# is the first run of four digits anywhere in the ProductName, so "4330",
+# "4330F" and "Optode 4330" all classify as oxygen.
+SENSOR_TYPES = {
+    "4117": "pressure", "5217": "pressure", "5218": "pressure",
+    "4330": "oxygen", "4835": "oxygen", "4831": "oxygen",
+    "5819": "conductivity", "5990": "conductivity",
+}
+_PRODUCT_NUMBER_RE = re.compile(r"\d{4}")
+
+
+def infer_sensor_type(product: Optional[str]) -> str:
+    """Map a ProductName/product number to its sensor_type ("unknown" if not listed)."""
+    match = _PRODUCT_NUMBER_RE.search(product or "")
+    return SENSOR_TYPES.get(match.group(), "unknown") if match else "unknown"
 
 
 def get_user_config_dir() -> Path:
@@ -38,6 +56,10 @@ def get_user_state_path() -> Path:
     return get_user_config_dir() / STATE_FILE_NAME
 
 
+def get_detection_cache_path() -> Path:
+    return get_user_config_dir() / DETECTION_CACHE_FILE_NAME
+
+
 def resolve_config_path(repo_local_path: Path) -> Path:
     """Prefer user config if it exists; otherwise use repo-local path."""
     user_path = get_user_config_path()
@@ -100,3 +122,28 @@ def save_state(payload: Dict[str, Any]) -> Path:
         json.dump(payload, f, indent=2)
     tmp.replace(path)
     return path
+
+
+def load_detection_cache() -> Dict[str, Any]:
+    """Load remembered sensor detections, keyed by USB adapter identity."""
+    path = get_detection_cache_path()
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        # A broken cache only means re-detecting.
+        return {}
+
+
+def save_detection_cache(payload: Dict[str, Any]) -> Path:
+    """Save remembered sensor detections to per-user config dir."""
+    path = get_detection_cache_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    tmp.replace(path)
+    return path
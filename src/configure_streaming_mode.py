@@ -25,15 +25,19 @@ import sys
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import List, Optional
 
 import serial
 
 from config_manager import load_sensors
+from serial_io import unique_ports
 
 
-@dataclass
+@dataclass(frozen=True)
 class CommandResult:
+    # Explicit __slots__ (not slots=True) keeps Python 3.7 support.
+    __slots__ = ("command", "response", "saw_ack")
+
     command: str
     response: str
     saw_ack: bool
@@ -106,15 +110,10 @@ class SensorTerminalSession:
         if not self.ser:
             raise RuntimeError("Serial not open")
 
-        # Wake by sending Enter a few times.
-        for _ in range(3):
-            self.ser.write(b"\r\n")
-            time.sleep(0.15)
-
-        # Some manuals mention that any character can wake from sleep.
-        self.ser.write(b";")
-        time.sleep(0.2)
-        return _drain_for(self.ser, 1.0)
+        # Wake by sending Enter a few times; some manuals mention that any
+        # character can wake from sleep. One write instead of one per line.
+        self.ser.write(b"\r\n" * 3 + b";")
+        return _drain_for(self.ser, 1.2)
 
     def run_command(
         self,
@@ -169,12 +168,7 @@ def _ports_from_config() -> List[str]:
     script_dir = Path(__file__).parent
     cfg = script_dir / "sensor_config.json"
     sensors = load_sensors(cfg)
-    ports: List[str] = []
-    for s in sensors:
-        p = (s.get("com_port") or "").strip()
-        if p and p not in ports:
-            ports.append(p)
-    return ports
+    return unique_ports(s.get("com_port") for s in sensors)
 
 
 def configure_port(
@@ -270,16 +264,10 @@ def main(argv: Optional[List[str]] = None) -> int:
 
     args = parser.parse_args(argv)
 
-    ports: List[str] = []
-    for p in args.ports:
-        p = (p or "").strip()
-        if p and p not in ports:
-            ports.append(p)
-
+    names = list(args.ports)
     if args.from_config:
-        for p in _ports_from_config():
-            if p not in ports:
-                ports.append(p)
+        names.extend(_ports_from_config())
+    ports = unique_ports(names)
 
     if not ports:
         parser.error("No ports specified. Use --ports or --from-config.")
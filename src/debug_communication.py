@@ -7,32 +7,75 @@ import serial
 import time
 import sys
 
+from config_manager import load_state, save_state
+from serial_tuning import enlarge_rx_buffer, set_low_latency
 
-def test_basic_serial(port, baudrate=9600):
+# Section header, written with one stdout call
+BANNER = "\n" + "="*70 + "\n{title}\n" + "="*70 + "\n"
+
+
+def open_port(port, baudrate=9600):
+    """Open a port once so every diagnostic step can share the same handle"""
+    print("\n[Step 1] Opening port...")
+    ser = serial.Serial(
+        port=port,
+        baudrate=baudrate,
+        bytesize=serial.EIGHTBITS,
+        parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE,
+        timeout=2,
+        write_timeout=2,
+        xonxoff=False,  # No software flow control
+        rtscts=False,   # No hardware flow control
+        dsrdtr=False    # No DSR/DTR flow control
+    )
+    set_low_latency(ser)
+    enlarge_rx_buffer(ser)
+    print(f"   ✓ Port {port} opened successfully")
+    print(f"   - Baudrate: {ser.baudrate}")
+    print(f"   - Timeout: {ser.timeout}s")
+    return ser
+
+
+def read_reply(ser, wait_s=None, quiet_s=0.1):
+    """Block up to wait_s (default ser.timeout) for the first byte, then read until quiet for quiet_s.
+
+    Returns raw bytes: replies are only shown via repr(), which needs no decode.
+    """
+    saved_timeout = ser.timeout
+    try:
+        if wait_s is not None:
+            ser.timeout = wait_s
+        first = ser.read(1)
+        if not first:
+            return b""
+        data = bytearray(first)
+        ser.timeout = quiet_s
+        while True:
+            chunk = ser.read(ser.in_waiting or 1)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        ser.timeout = saved_timeout
+    return bytes(data)
+
+
+def probe(ser, command, wait_s=None):
+    """Send command and return the raw reply; stale input is purged only if there is any"""
+    if ser.in_waiting:
+        ser.reset_input_buffer()
+    ser.write(command)
+    return read_reply(ser, wait_s)
+
+
+def test_basic_serial(ser):
     """Test basic serial communication with detailed output"""
-    print(f"\n{'='*70}")
-    print(f"DEBUGGING: {port} at {baudrate} baud")
-    print('='*70)
+    port = ser.port
+    baudrate = ser.baudrate
+    sys.stdout.write(BANNER.format(title=f"DEBUGGING: {port} at {baudrate} baud"))
     
     try:
-        # Open port
-        print("\n[Step 1] Opening port...")
-        ser = serial.Serial(
-            port=port,
-            baudrate=baudrate,
-            bytesize=serial.EIGHTBITS,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            timeout=2,
-            write_timeout=2,
-            xonxoff=False,  # No software flow control
-            rtscts=False,   # No hardware flow control
-            dsrdtr=False    # No DSR/DTR flow control
-        )
-        print(f"   ✓ Port {port} opened successfully")
-        print(f"   - Baudrate: {ser.baudrate}")
-        print(f"   - Timeout: {ser.timeout}s")
-        
         # Check control signals
         print(f"\n[Step 2] Checking control signals...")
         print(f"   - CTS (Clear to Send): {ser.cts}")
@@ -49,14 +92,10 @@ def test_basic_serial(port, baudrate=9600):
         
         # Test 1: Simple wake-up with carriage returns
         print(f"\n[Test 1] Sending carriage returns only...")
-        for i in range(10):
-            ser.write(b'\r\n')
-            time.sleep(0.1)
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                print(f"   ✓ Got response after {i+1} CR: {repr(response)}")
-                ser.reset_input_buffer()
-                break
+        ser.write(b'\r\n' * 10)
+        response = read_reply(ser)
+        if response:
+            print(f"   ✓ Got response to carriage returns: {repr(response)}")
         else:
             print(f"   ✗ No response to carriage returns")
         
@@ -64,38 +103,24 @@ def test_basic_serial(port, baudrate=9600):
         
         # Test 2: Wake with '%' character
         print(f"\n[Test 2] Sending '%' character (wake from sleep)...")
-        ser.reset_input_buffer()
-        ser.write(b'%')
-        time.sleep(1.0)
-        if ser.in_waiting > 0:
-            response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+        response = probe(ser, b'%', wait_s=1.0)
+        if response:
             print(f"   ✓ Response: {repr(response)}")
         else:
             print(f"   ✗ No response to '%'")
         
         # Test 3: Full wake-up sequence
         print(f"\n[Test 3] Full documented wake-up sequence...")
-        ser.reset_input_buffer()
-        for _ in range(5):
-            ser.write(b'\r\n')
-            time.sleep(0.15)
-        ser.write(b'%')
-        time.sleep(1.5)  # Longer wait
-        
-        if ser.in_waiting > 0:
-            response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+        response = probe(ser, b'\r\n' * 5 + b'%')
+        if response:
             print(f"   ✓ Response: {repr(response)}")
         else:
             print(f"   ℹ No immediate response (may be normal)")
         
         # Test 4: Try HELP command
         print(f"\n[Test 4] Sending HELP command...")
-        ser.reset_input_buffer()
-        ser.write(b'HELP\r\n')
-        time.sleep(1.5)
-        
-        if ser.in_waiting > 0:
-            response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+        response = probe(ser, b'HELP\r\n')
+        if response:
             print(f"   ✓ HELP response ({len(response)} bytes):")
             print(f"   {repr(response[:200])}")
             return {'success': True, 'mode': 'Terminal', 'response': response}
@@ -104,12 +129,8 @@ def test_basic_serial(port, baudrate=9600):
         
         # Test 5: Try $GET command
         print(f"\n[Test 5] Sending $GET ProductName...")
-        ser.reset_input_buffer()
-        ser.write(b'$GET ProductName\r\n')
-        time.sleep(1.5)
-        
-        if ser.in_waiting > 0:
-            response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+        response = probe(ser, b'$GET ProductName\r\n')
+        if response:
             print(f"   ✓ $GET response:")
             print(f"   {repr(response)}")
             return {'success': True, 'mode': 'Terminal', 'response': response}
@@ -118,12 +139,8 @@ def test_basic_serial(port, baudrate=9600):
         
         # Test 6: Try DO command
         print(f"\n[Test 6] Sending DO command (measurement)...")
-        ser.reset_input_buffer()
-        ser.write(b'DO\r\n')
-        time.sleep(2.0)
-        
-        if ser.in_waiting > 0:
-            response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+        response = probe(ser, b'DO\r\n')
+        if response:
             print(f"   ✓ DO response:")
             print(f"   {repr(response)}")
             return {'success': True, 'mode': 'Terminal', 'response': response}
@@ -150,19 +167,13 @@ def test_basic_serial(port, baudrate=9600):
         print(f"\n[Test 8] Checking for AiCaP mode indicators...")
         print(f"   (AiCaP sensors won't respond to RS-232 commands)")
         print(f"   Trying XML format request...")
-        ser.reset_input_buffer()
-        ser.write(b'<?xml version="1.0"?><sensor><get>ProductName</get></sensor>\r\n')
-        time.sleep(1.5)
-        
-        if ser.in_waiting > 0:
-            response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+        response = probe(ser, b'<?xml version="1.0"?><sensor><get>ProductName</get></sensor>\r\n')
+        if response:
             print(f"   ✓ XML response: {repr(response)}")
             return {'success': True, 'mode': 'Real-Time', 'response': response}
         else:
             print(f"   ✗ No response to XML either")
         
-        ser.close()
-        
         print(f"\n{'─'*70}")
         print(f"RESULT: No communication established")
         print(f"{'─'*70}")
@@ -177,38 +188,51 @@ def test_basic_serial(port, baudrate=9600):
         return {'success': False, 'error': str(e)}
 
 
-def test_different_baudrates(port):
-    """Test multiple baudrates"""
-    print(f"\n{'='*70}")
-    print(f"TESTING DIFFERENT BAUDRATES on {port}")
-    print('='*70)
+def test_different_baudrates(ser):
+    """Test multiple baudrates on an already open port"""
+    sys.stdout.write(BANNER.format(title=f"TESTING DIFFERENT BAUDRATES on {ser.port}"))
     
     baudrates = [9600, 19200, 4800, 57600, 115200]
     
+    # Try the rate that worked on this port last time first
+    state = load_state()
+    known = state.get("baudrates", {})
+    if not isinstance(known, dict):
+        known = {}
+    preferred = known.get(ser.port)
+    if preferred in baudrates:
+        baudrates.remove(preferred)
+        baudrates.insert(0, preferred)
+    
     for baud in baudrates:
         print(f"\n[Testing {baud} baud]")
         try:
-            ser = serial.Serial(port, baud, timeout=1)
+            # Reconfigure in place instead of reopening the port
+            ser.baudrate = baud
             
             # Quick test
             ser.reset_input_buffer()
-            for _ in range(3):
-                ser.write(b'\r\n')
-                time.sleep(0.1)
+            # One write for the wake burst; 10 bits per byte on the wire
+            wake = b'\r\n' * 3
+            ser.write(wake)
+            ser.flush()
+            time.sleep(max(0.1, len(wake) * 10 / baud + 0.05))
             ser.write(b'HELP\r\n')
-            time.sleep(1)
-            
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+            response = read_reply(ser, wait_s=1.0)
+            if response:
                 print(f"   ✓ RESPONSE at {baud} baud!")
                 print(f"   {repr(response[:100])}")
-                ser.close()
+                if baud != preferred:
+                    known[ser.port] = baud
+                    state["baudrates"] = known
+                    try:
+                        save_state(state)
+                    except OSError as e:
+                        print(f"   ⚠ Could not remember baudrate: {e}")
                 return baud
             else:
                 print(f"   ✗ No response at {baud} baud")
             
-            ser.close()
-            
         except Exception as e:
             print(f"   ✗ Error at {baud}: {e}")
     
@@ -216,15 +240,14 @@ def test_different_baudrates(port):
     return None
 
 
-def test_continuous_read(port, baudrate=9600, duration=10):
+def test_continuous_read(ser, baudrate=9600, duration=10):
     """Read continuously to see if sensor is sending data"""
-    print(f"\n{'='*70}")
-    print(f"CONTINUOUS READ TEST on {port}")
-    print(f"Reading for {duration} seconds to detect any data...")
-    print('='*70)
+    sys.stdout.write(BANNER.format(
+        title=f"CONTINUOUS READ TEST on {ser.port}\nReading for {duration} seconds to detect any data..."
+    ))
     
     try:
-        ser = serial.Serial(port, baudrate, timeout=0.1)
+        ser.baudrate = baudrate
         
         print(f"\n[Listening] Press Ctrl+C to stop early...")
         start = time.time()
@@ -236,9 +259,7 @@ def test_continuous_read(port, baudrate=9600, duration=10):
                 total_bytes += len(data)
                 print(f"\n[{time.time()-start:.1f}s] Received {len(data)} bytes:")
                 print(f"   Hex: {data.hex()}")
-                print(f"   ASCII: {repr(data.decode('ascii', errors='ignore'))}")
-        
-        ser.close()
+                print(f"   ASCII: {repr(data.decode('ascii', errors='replace'))}")
         
         print(f"\n{'─'*70}")
         print(f"Total bytes received: {total_bytes}")
@@ -248,7 +269,6 @@ def test_continuous_read(port, baudrate=9600, duration=10):
         
     except KeyboardInterrupt:
         print(f"\n\n[Stopped by user]")
-        ser.close()
     except Exception as e:
         print(f"\n✗ Error: {e}")
 
@@ -260,33 +280,39 @@ def diagnose_port(port):
     print(f"# COMPREHENSIVE DIAGNOSTIC: {port}")
     print(f"{'#'*70}")
     
-    # Test 1: Basic communication
-    result = test_basic_serial(port)
-    
-    if result.get('success'):
-        print(f"\n✓✓✓ SUCCESS! Sensor responding on {port}")
-        return result
-    
-    # Test 2: Try different baudrates
-    print(f"\n[Trying different baudrates...]")
-    working_baud = test_different_baudrates(port)
-    
-    if working_baud:
-        print(f"\n✓ Found working baudrate: {working_baud}")
-        return {'success': True, 'baudrate': working_baud}
+    try:
+        ser = open_port(port)
+    except serial.SerialException as e:
+        print(f"\n✗ Serial Error: {e}")
+        return {'success': False, 'error': str(e)}
     
-    # Test 3: Continuous read
-    print(f"\n[Checking if sensor is transmitting anything...]")
-    test_continuous_read(port, duration=5)
+    # One handle for the whole run; the baudrate is changed in place
+    with ser:
+        # Test 1: Basic communication
+        result = test_basic_serial(ser)
+        
+        if result.get('success'):
+            print(f"\n✓✓✓ SUCCESS! Sensor responding on {port}")
+            return result
+        
+        # Test 2: Try different baudrates
+        print(f"\n[Trying different baudrates...]")
+        working_baud = test_different_baudrates(ser)
+        
+        if working_baud:
+            print(f"\n✓ Found working baudrate: {working_baud}")
+            return {'success': True, 'baudrate': working_baud}
+        
+        # Test 3: Continuous read
+        print(f"\n[Checking if sensor is transmitting anything...]")
+        test_continuous_read(ser, duration=5)
     
     return result
 
 
 def main():
     """Main diagnostic"""
-    print("\n" + "="*70)
-    print("AANDERAA SENSOR COMMUNICATION DEBUG TOOL")
-    print("="*70)
+    sys.stdout.write(BANNER.format(title="AANDERAA SENSOR COMMUNICATION DEBUG TOOL"))
     print("\nThis tool performs detailed communication tests")
     print("to identify why sensors aren't responding.")
     
@@ -308,19 +334,17 @@ def main():
     
     results = {}
     
+    # Each diagnostic closes its own handle, so the next port can start right away
     for port in ports:
-        result = diagnose_port(port)
-        results[port] = result
-        time.sleep(1)
+        results[port] = diagnose_port(port)
     
     # Summary
-    print(f"\n\n")
-    print(f"{'='*70}")
-    print(f"DIAGNOSTIC SUMMARY")
-    print(f"{'='*70}")
+    print("\n")
+    sys.stdout.write(BANNER.format(title="DIAGNOSTIC SUMMARY"))
     
-    working = [p for p, r in results.items() if r.get('success')]
-    not_working = [p for p, r in results.items() if not r.get('success')]
+    working, not_working = [], []
+    for p, r in results.items():
+        (working if r.get('success') else not_working).append(p)
     
     if working:
         print(f"\n✓ Ports with communication: {', '.join(working)}")
@@ -334,9 +358,7 @@ def main():
         print(f"  4. Sensor firmware not responding")
         print(f"  5. Need to use Aanderaa Real-Time Collector first")
     
-    print(f"\n{'='*70}")
-    print(f"RECOMMENDATIONS")
-    print(f"{'='*70}")
+    sys.stdout.write(BANNER.format(title="RECOMMENDATIONS"))
     
     if not working and not_working:
         print(f"\n⚠️  NO SENSORS RESPONDING via RS-232 commands")
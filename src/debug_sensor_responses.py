@@ -5,6 +5,19 @@ This will show exactly what each sensor is saying
 import serial
 import time
 
+from serial_tuning import enlarge_rx_buffer, set_low_latency
+
+def _drain(ser, max_polls=8, poll_s=0.3):
+    """Collect a reply until the line goes quiet after data, decoding it once at the end"""
+    buf = bytearray()
+    for _ in range(max_polls):
+        if ser.in_waiting > 0:
+            buf += ser.read(ser.in_waiting)
+        elif buf:
+            break
+        time.sleep(poll_s)
+    return buf.decode('ascii', errors='ignore')
+
 def debug_sensor(port_name):
     """Show raw responses from sensor"""
     print(f"\n{'='*70}")
@@ -21,6 +34,8 @@ def debug_sensor(port_name):
             dsrdtr=False
         )
         
+        set_low_latency(ser)
+        enlarge_rx_buffer(ser)
         print(f"✓ Port opened\n")
         
         # Clear buffers
@@ -30,11 +45,7 @@ def debug_sensor(port_name):
         
         # Wake up sensor
         print("[1] Waking up sensor...")
-        for _ in range(5):
-            ser.write(b'\r\n')
-            time.sleep(0.2)
-        
-        ser.write(b'%')
+        ser.write(b'\r\n' * 5 + b'%')
         time.sleep(0.5)
         
         # Clear wake-up response
@@ -47,18 +58,7 @@ def debug_sensor(port_name):
         ser.write(b'$GET ProductName\r\n')
         time.sleep(1.5)  # Longer wait
         
-        response1 = ""
-        attempts = 0
-        while attempts < 8:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                response1 += chunk
-                time.sleep(0.3)
-            else:
-                if response1:
-                    break
-                time.sleep(0.3)
-            attempts += 1
+        response1 = _drain(ser)
         
         print(f"RAW RESPONSE (length={len(response1)} bytes):")
         print(f"'{response1}'")
@@ -69,22 +69,10 @@ def debug_sensor(port_name):
         # Test 2: Get Serial Number
         print(f"\n[3] Sending: $GET SerialNumber")
         ser.reset_input_buffer()
-        time.sleep(0.5)
         ser.write(b'$GET SerialNumber\r\n')
         time.sleep(1.5)
         
-        response2 = ""
-        attempts = 0
-        while attempts < 8:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                response2 += chunk
-                time.sleep(0.3)
-            else:
-                if response2:
-                    break
-                time.sleep(0.3)
-            attempts += 1
+        response2 = _drain(ser)
         
         print(f"RAW RESPONSE (length={len(response2)} bytes):")
         print(f"'{response2}'")
@@ -95,22 +83,10 @@ def debug_sensor(port_name):
         # Test 3: Try HELP command
         print(f"\n[4] Sending: HELP")
         ser.reset_input_buffer()
-        time.sleep(0.5)
         ser.write(b'HELP\r\n')
         time.sleep(1.5)
         
-        response3 = ""
-        attempts = 0
-        while attempts < 8:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                response3 += chunk
-                time.sleep(0.3)
-            else:
-                if response3:
-                    break
-                time.sleep(0.3)
-            attempts += 1
+        response3 = _drain(ser)
         
         print(f"RAW RESPONSE (length={len(response3)} bytes):")
         print(f"'{response3[:500]}'")  # First 500 chars
@@ -118,22 +94,10 @@ def debug_sensor(port_name):
         # Test 4: Try DO command
         print(f"\n[5] Sending: DO")
         ser.reset_input_buffer()
-        time.sleep(0.5)
         ser.write(b'DO\r\n')
         time.sleep(2.0)  # DO takes longer
         
-        response4 = ""
-        attempts = 0
-        while attempts < 10:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                response4 += chunk
-                time.sleep(0.3)
-            else:
-                if response4:
-                    break
-                time.sleep(0.3)
-            attempts += 1
+        response4 = _drain(ser, 10)
         
         print(f"RAW RESPONSE (length={len(response4)} bytes):")
         print(f"'{response4[:500]}'")  # First 500 chars
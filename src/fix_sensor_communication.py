@@ -4,13 +4,23 @@ Step-by-step approach to get data from Aanderaa sensors
 """
 
 import serial
+import string
+import threading
 import time
 import sys
+import logging
+
+from config_manager import load_state, save_state
+from serial_tuning import enlarge_rx_buffer, set_low_latency
+
+# Progress output goes through one logger on stdout so it stays in order with prompts
+logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
 
 
 def try_communication_method(ser, method_name, commands, wait_time=1.5):
     """Try a specific communication method"""
-    print(f"\n  [{method_name}]")
+    lines = [f"\n  [{method_name}]"]
     
     ser.reset_input_buffer()
     ser.reset_output_buffer()
@@ -21,28 +31,100 @@ def try_communication_method(ser, method_name, commands, wait_time=1.5):
         elif isinstance(cmd, (int, float)):
             time.sleep(cmd)
     
+    # Wait up to wait_time for the reply to start, then read until the line goes quiet
+    # (a multi-line reply such as HELP spans several CRLFs)
+    saved_timeout = ser.timeout
+    ser.timeout = wait_time
+    try:
+        raw = read_burst(ser, gap=0.3, limit=4096)
+    finally:
+        ser.timeout = saved_timeout
+    
+    if raw:
+        data = raw.decode('ascii', errors='ignore')
+        lines.append(f"    ✓ SUCCESS! Got response: {repr(data[:150])}")
+        logger.info("\n".join(lines))
+        return True, data
+    else:
+        lines.append(f"    ✗ No response")
+        logger.info("\n".join(lines))
+        return False, None
+
+
+def read_burst(ser, gap=0.1, limit=512):
+    """Read a reply until the line stays quiet for `gap` seconds (or `limit` bytes)"""
+    first = ser.read(1)  # Blocks up to ser.timeout for the reply to start
+    if not first:
+        return b''
+    
+    buf = bytearray(first)
+    saved_timeout = ser.timeout
+    ser.timeout = gap
+    try:
+        while len(buf) < limit:
+            chunk = ser.read(256)
+            if not chunk:
+                break
+            buf += chunk
+    finally:
+        ser.timeout = saved_timeout
+    return bytes(buf)
+
+
+def try_dtr_rts(ser, method_name, commands, wait_time=2.0):
+    """Try the standard wake + HELP with DTR/RTS enabled"""
+    lines = [f"\n  [With DTR/RTS enabled]"]
+    ser.dtr = True
+    ser.rts = True
+    time.sleep(0.5)
+    ser.reset_input_buffer()
+    ser.write(b'\r\n' * 5 + b'HELP\r\n')
     time.sleep(wait_time)
     
     if ser.in_waiting > 0:
         data = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-        print(f"    ✓ SUCCESS! Got response: {repr(data[:150])}")
+        lines.append(f"    ✓ SUCCESS with DTR/RTS! {repr(data[:150])}")
+        logger.info("\n".join(lines))
         return True, data
     else:
-        print(f"    ✗ No response")
+        lines.append(f"    ✗ No response")
+        logger.info("\n".join(lines))
+        ser.dtr = False
+        ser.rts = False
         return False, None
 
 
-def test_all_methods(port, baudrate=9600):
-    """Try every possible method to communicate"""
-    print(f"\n{'='*70}")
-    print(f"TRYING ALL COMMUNICATION METHODS: {port}")
-    print('='*70)
+# (name, commands, wait_time) tried in order by test_all_methods.
+# Numbers inside commands are pauses in seconds.
+METHODS = (
+    ("Simple CR", (b'\r\n' * 5 + b'HELP\r\n',), 1.5),
+    ("With % wake", (b'\r\n' * 3 + b'%', 0.5, b'HELP\r\n'), 2.0),
+    ("Long wake", (b'\r\n' * 20, 1.0, b'HELP\r\n'), 2.0),
+    ("$GET ProductName", (b'\r\n' * 5 + b'%', 0.5, b'$GET ProductName\r\n'), 2.0),
+    ("DO command", (b'\r\n' * 5 + b'DO\r\n',), 2.5),
+    ("With DTR/RTS", None, 2.0),  # Special handling, see METHOD_HANDLERS
+    ("Just listen", (), 3.0),  # Just wait for data
+)
+
+# Methods that need more than writing commands; everything else uses try_communication_method
+METHOD_HANDLERS = {
+    "With DTR/RTS": try_dtr_rts,
+}
+
+
+class SerialPool:
+    """Keep one port open for the whole troubleshooting flow and reconfigure it per step"""
     
-    try:
-        # Open port with all flow control disabled
-        ser = serial.Serial(
-            port=port,
-            baudrate=baudrate,
+    def __init__(self, port, baudrate=9600):
+        self.port = port
+        self.baudrate = baudrate
+        self.ser = None
+    
+    def __enter__(self):
+        # All flow control disabled
+        self.ser = serial.Serial(
+            port=self.port,
+            baudrate=self.baudrate,
             bytesize=8,
             parity='N',
             stopbits=1,
@@ -51,96 +133,95 @@ def test_all_methods(port, baudrate=9600):
             rtscts=False,
             dsrdtr=False
         )
+        set_low_latency(self.ser)
+        enlarge_rx_buffer(self.ser)
+        return self
+    
+    def configure(self, baudrate, timeout=None):
+        """Switch baudrate (and optionally timeout) in place and return the open port"""
+        # No buffer reset here: each probe resets once at its own start
+        self.ser.baudrate = baudrate
+        if timeout is not None:
+            self.ser.timeout = timeout
+        return self.ser
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self.ser and self.ser.is_open:
+            self.ser.close()
+        self.ser = None
+
+
+def test_all_methods(ser):
+    """Try every possible method to communicate"""
+    logger.info(f"\n{'='*70}\nTRYING ALL COMMUNICATION METHODS: {ser.port}\n{'='*70}")
+    logger.info(f"\n✓ Port opened: {ser.port} @ {ser.baudrate} baud")
+    
+    try:
+        for name, cmds, wait in METHODS:
+            handler = METHOD_HANDLERS.get(name, try_communication_method)
+            success, data = handler(ser, name, cmds, wait)
+            if success:
+                return True, name, data
         
-        print(f"\n✓ Port opened: {port} @ {baudrate} baud")
-        
-        methods = [
-            ("Simple CR", [b'\r\n' * 5, b'HELP\r\n'], 1.5),
-            ("With % wake", [b'\r\n' * 3, b'%', 0.5, b'HELP\r\n'], 2.0),
-            ("Long wake", [b'\r\n' * 20, 1.0, b'HELP\r\n'], 2.0),
-            ("$GET ProductName", [b'\r\n' * 5, b'%', 0.5, b'$GET ProductName\r\n'], 2.0),
-            ("DO command", [b'\r\n' * 5, b'DO\r\n'], 2.5),
-            ("With DTR/RTS", None, 0),  # Special handling
-            ("Just listen", [], 3.0),  # Just wait for data
-        ]
-        
-        for i, method in enumerate(methods, 1):
-            if len(method) == 3:
-                name, cmds, wait = method
-                
-                if name == "With DTR/RTS":
-                    # Try with DTR/RTS enabled
-                    print(f"\n  [With DTR/RTS enabled]")
-                    ser.dtr = True
-                    ser.rts = True
-                    time.sleep(0.5)
-                    ser.reset_input_buffer()
-                    ser.write(b'\r\n' * 5)
-                    ser.write(b'HELP\r\n')
-                    time.sleep(2)
-                    
-                    if ser.in_waiting > 0:
-                        data = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                        print(f"    ✓ SUCCESS with DTR/RTS! {repr(data[:150])}")
-                        ser.close()
-                        return True, 'DTR/RTS', data
-                    else:
-                        print(f"    ✗ No response")
-                        ser.dtr = False
-                        ser.rts = False
-                else:
-                    success, data = try_communication_method(ser, name, cmds, wait)
-                    if success:
-                        ser.close()
-                        return True, name, data
-        
-        ser.close()
         return False, None, None
         
     except Exception as e:
-        print(f"\n✗ Error: {e}")
+        logger.info(f"\n✗ Error: {e}")
         return False, None, str(e)
 
 
-def test_different_baudrates(port):
+def test_different_baudrates(ser):
     """Quickly test common baudrates"""
-    print(f"\n{'='*70}")
-    print(f"TESTING DIFFERENT BAUDRATES: {port}")
-    print('='*70)
+    logger.info(f"\n{'='*70}\nTESTING DIFFERENT BAUDRATES: {ser.port}\n{'='*70}")
     
     baudrates = [9600, 19200, 4800, 57600, 115200]
+    ser.timeout = 1
     
+    # Try the rate that worked on this port last time first
+    state = load_state()
+    known = state.get("baudrates", {})
+    if not isinstance(known, dict):
+        known = {}
+    preferred = known.get(ser.port)
+    if preferred in baudrates:
+        baudrates.remove(preferred)
+        baudrates.insert(0, preferred)
+    
+    # Reconfigure the baudrate in place (avoids re-init and DTR pulses)
     for baud in baudrates:
-        print(f"\n[{baud} baud]", end='')
+        status = f"\n[{baud} baud]"
         try:
-            ser = serial.Serial(port, baud, timeout=1)
+            ser.baudrate = baud
             ser.reset_input_buffer()
             
-            # Quick test
-            ser.write(b'\r\n' * 3)
-            ser.write(b'HELP\r\n')
-            time.sleep(1)
+            # Quick test: waits up to the 1 s timeout for a reply to start,
+            # then reads until a 0.1 s inter-byte gap
+            ser.write(b'\r\n' * 3 + b'HELP\r\n')
+            raw = read_burst(ser)
             
-            if ser.in_waiting > 0:
-                data = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                print(f" ✓ WORKS!")
-                print(f"    Response: {repr(data[:100])}")
-                ser.close()
+            if raw:
+                data = raw.decode('ascii', errors='ignore')
+                logger.info(f"{status} ✓ WORKS!\n    Response: {repr(data[:100])}")
+                if baud != preferred:
+                    known[ser.port] = baud
+                    state["baudrates"] = known
+                    try:
+                        save_state(state)
+                    except OSError as e:
+                        logger.info(f"    ⚠ Could not remember baudrate: {e}")
                 return baud
             else:
-                print(f" ✗")
-            
-            ser.close()
+                logger.info(f"{status} ✗")
         except:
-            print(f" ✗ Error")
+            logger.info(f"{status} ✗ Error")
     
     return None
 
 
-def interactive_test(port):
+def interactive_test(ser):
     """Interactive manual testing"""
     print(f"\n{'='*70}")
-    print(f"INTERACTIVE MANUAL TEST: {port}")
+    print(f"INTERACTIVE MANUAL TEST: {ser.port}")
     print('='*70)
     
     print("\nYou can manually send commands to the sensor.")
@@ -151,53 +232,61 @@ def interactive_test(port):
     print("  DO")
     print("  (or type 'quit' to exit)")
     
-    try:
-        ser = serial.Serial(port, 9600, timeout=1)
-        print(f"\n✓ Port opened. Type commands below:")
-        
-        while True:
-            cmd = input("\n> ").strip()
-            
-            if cmd.lower() in ['quit', 'exit', 'q']:
+    CRLF = b'\r\n'
+    stop = threading.Event()
+    
+    def reader():
+        # Print everything the sensor sends, including unsolicited output
+        while not stop.is_set():
+            try:
+                data = ser.read(4096)  # Returns after ser.timeout when idle
+            except Exception:
                 break
-            
-            if not cmd:
-                continue
-            
-            # Send command
-            ser.reset_input_buffer()
-            ser.write((cmd + '\r\n').encode())
-            time.sleep(1.5)
-            
-            # Read response
-            if ser.in_waiting > 0:
-                data = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                print(f"\nResponse:\n{data}")
-            else:
-                print("\n(No response)")
+            if data:
+                sys.stdout.write(data.decode('ascii', errors='ignore'))
+                sys.stdout.flush()
+    
+    try:
+        ser.baudrate = 9600
+        ser.timeout = 0.1
+        ser.write_timeout = 0.5
+        ser.reset_input_buffer()
+        print(f"\n✓ Port ready. Type commands below (replies print as they arrive):")
         
-        ser.close()
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        try:
+            while True:
+                cmd = input("\n> ").strip()
+                
+                if cmd.lower() in ['quit', 'exit', 'q']:
+                    break
+                
+                if not cmd:
+                    continue
+                
+                ser.write(cmd.encode('ascii', errors='ignore') + CRLF)
+        finally:
+            stop.set()
+            thread.join(timeout=1.0)
         
     except Exception as e:
         print(f"\n✗ Error: {e}")
 
 
-def show_working_script(port, method, baudrate=9600):
-    """Generate a working script based on successful method"""
-    print(f"\n{'='*70}")
-    print(f"WORKING CODE FOR YOUR SETUP")
-    print('='*70)
-    
-    dtr_rts = "DTR/RTS" in method
-    
-    print(f"""
+# Snippet printed by show_working_script ($$ is a literal $)
+WORKING_SCRIPT_TEMPLATE = string.Template("""
+$rule
+WORKING CODE FOR YOUR SETUP
+$rule
+
 # Save this as working_sensor_test.py
 
 import serial
 import time
 
-port = '{port}'
-baudrate = {baudrate}
+port = $port
+baudrate = $baudrate
 
 ser = serial.Serial(
     port=port,
@@ -208,18 +297,8 @@ ser = serial.Serial(
     dsrdtr=False
 )
 
-print(f"Connected to {{port}}")
-""")
-    
-    if dtr_rts:
-        print("""
-# Enable DTR/RTS (required for your setup)
-ser.dtr = True
-ser.rts = True
-time.sleep(0.5)
-""")
-    
-    print("""
+print(f"Connected to {port}")
+$dtr_rts_block
 # Wake up sensor
 for _ in range(5):
     ser.write(b'\\r\\n')
@@ -229,7 +308,7 @@ ser.write(b'%')
 time.sleep(1)
 
 # Get sensor info
-ser.write(b'$GET ProductName\\r\\n')
+ser.write(b'$$GET ProductName\\r\\n')
 time.sleep(1)
 
 if ser.in_waiting > 0:
@@ -247,29 +326,32 @@ if ser.in_waiting > 0:
 ser.close()
 """)
 
+DTR_RTS_BLOCK = """
+# Enable DTR/RTS (required for your setup)
+ser.dtr = True
+ser.rts = True
+time.sleep(0.5)
+"""
 
-def main():
-    """Main troubleshooting flow"""
-    print("\n" + "="*70)
-    print("AANDERAA SENSOR - GET DATA NOW!")
-    print("="*70)
-    
-    print("\nThis will try every method to get your sensors working.")
-    
-    # Get COM ports
-    port_input = input("\nEnter COM port to test (e.g., COM3): ").strip().upper()
-    if not port_input.startswith('COM'):
-        port_input = 'COM' + port_input
-    
-    port = port_input
-    
-    print(f"\n{'#'*70}")
-    print(f"# TESTING {port}")
-    print(f"{'#'*70}")
+
+def show_working_script(port, method, baudrate=9600):
+    """Generate a working script based on successful method"""
+    dtr_rts_block = DTR_RTS_BLOCK if "DTR/RTS" in method else ""
+    print(WORKING_SCRIPT_TEMPLATE.substitute(
+        rule='=' * 70,
+        port=repr(port),
+        baudrate=baudrate,
+        dtr_rts_block=dtr_rts_block,
+    ))
+
+
+def troubleshoot(pool):
+    """Run the troubleshooting steps on an already open port"""
+    port = pool.port
     
     # Step 1: Try all methods at 9600 baud
     print("\n[STEP 1] Trying all communication methods at 9600 baud...")
-    success, method, data = test_all_methods(port, 9600)
+    success, method, data = test_all_methods(pool.configure(9600))
     
     if success:
         print(f"\n{'='*70}")
@@ -281,13 +363,13 @@ def main():
         
         # Offer interactive test
         if input("\nTry interactive mode? (y/n): ").lower() == 'y':
-            interactive_test(port)
+            interactive_test(pool.ser)
         
         return
     
     # Step 2: Try different baudrates
     print("\n[STEP 2] Trying different baudrates...")
-    working_baud = test_different_baudrates(port)
+    working_baud = test_different_baudrates(pool.ser)
     
     if working_baud:
         print(f"\n{'='*70}")
@@ -329,7 +411,34 @@ def main():
     
     # Offer interactive mode anyway
     if input("\nTry interactive mode to test manually? (y/n): ").lower() == 'y':
-        interactive_test(port)
+        interactive_test(pool.ser)
+
+
+def main():
+    """Main troubleshooting flow"""
+    print("\n" + "="*70)
+    print("AANDERAA SENSOR - GET DATA NOW!")
+    print("="*70)
+    
+    print("\nThis will try every method to get your sensors working.")
+    
+    # Get COM ports
+    port_input = input("\nEnter COM port to test (e.g., COM3): ").strip().upper()
+    if not port_input.startswith('COM'):
+        port_input = 'COM' + port_input
+    
+    port = port_input
+    
+    print(f"\n{'#'*70}")
+    print(f"# TESTING {port}")
+    print(f"{'#'*70}")
+    
+    # One open port for every step
+    try:
+        with SerialPool(port, 9600) as pool:
+            troubleshoot(pool)
+    except serial.SerialException as e:
+        print(f"\n✗ Serial error on {port}: {e}")
 
 
 if __name__ == "__main__":
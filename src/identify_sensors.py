@@ -2,26 +2,137 @@
 Identify which Aanderaa sensor is on which COM port
 This will tell you the actual sensor type connected to each port
 """
+import argparse
+import json
+import re
 import serial
+import sys
 import time
+from dataclasses import dataclass
 
-def identify_sensor(port_name):
+from config_manager import infer_sensor_type, load_detection_cache, save_detection_cache
+from serial_io import run_per_port
+from serial_tuning import enlarge_rx_buffer, set_low_latency
+
+# Parsed straight from the raw reply bytes; the value is the rest of its line, up to any '#' prompt
+_PROD_RE = re.compile(rb'ProductName[ \t]*=[ \t]*([^\r\n#]*)', re.I)
+_SN_RE = re.compile(rb'SerialNumber[ \t]*=[ \t]*([^\r\n#]*)', re.I)
+
+# Prefix for the generated sensor name, by sensor_type
+_TYPE_LABELS = {
+    'pressure': "Pressure Sensor",
+    'oxygen': "Oxygen Optode",
+    'conductivity': "Conductivity Sensor",
+}
+
+# USB-serial adapters used with the sensors: FTDI, Silicon Labs CP210x, Prolific, WCH CH340, NI USB-232 hubs
+ADAPTER_VIDS = frozenset((0x0403, 0x10C4, 0x067B, 0x1A86, 0x3923))
+
+# Broadcom Bluetooth radios; their SPP ports can block for seconds on open
+BLUETOOTH_VIDS = frozenset((0x0A5C,))
+
+
+@dataclass
+class SensorInfo:
+    """Identification result for one port"""
+    __slots__ = ('port', 'success', 'product_name', 'serial_number', 'sensor_type', 'full_name', 'error')
+    
+    port: str
+    success: bool
+    product_name: str
+    serial_number: str
+    sensor_type: str
+    full_name: str
+    error: str
+    
+    @classmethod
+    def failed(cls, port, error):
+        return cls(port, False, "UNKNOWN", "UNKNOWN", "UNKNOWN", "", error)
+
+
+def filter_candidate_ports(ports):
+    """Keep ListPortInfo entries that look like USB-serial adapters (all non-Bluetooth ports if none match)"""
+    candidates = []
+    for p in ports:
+        # The numeric VID is decisive; description strings are only consulted when it is missing
+        # (on Windows they can cost extra SetupAPI lookups per port).
+        if p.vid is not None:
+            if p.vid in ADAPTER_VIDS:
+                candidates.append(p)
+        elif 'USB' in (p.description or ''):
+            candidates.append(p)
+    return candidates or [p for p in ports if not is_bluetooth_port(p)]
+
+
+def is_bluetooth_port(port_info):
+    """True for Bluetooth SPP ports, which are never sensor adapters and are slow to open"""
+    if port_info.vid is not None:
+        return port_info.vid in BLUETOOTH_VIDS
+    return 'bluetooth' in (port_info.description or '').lower()
+
+
+def find_candidate_ports():
+    """Return ListPortInfo for devices that look like USB-serial adapters (all non-Bluetooth ports if none match)"""
+    # Imported here: list_ports loads platform enumeration backends that only this path needs
+    from serial.tools.list_ports import comports
+    return filter_candidate_ports(list(comports()))
+
+
+def usb_port_key(port_info):
+    """Stable cache key for a USB port (VID:PID:serial:device), or None for non-USB ports"""
+    if port_info.vid is None:
+        return None
+    return f"{port_info.vid:04x}:{port_info.pid:04x}:{port_info.serial_number}:{port_info.device}"
+
+
+def _from_cache(port, entry):
+    return SensorInfo(
+        port, True, entry['product_name'], entry['serial_number'],
+        entry['sensor_type'], entry['full_name'], "",
+    )
+
+
+def _read_response(ser, patterns, timeout_s=4.0, idle_s=0.3):
+    """Read until every pattern has matched, the line stays idle after data, or timeout_s expires"""
+    buf = bytearray()
+    deadline = time.monotonic() + timeout_s
+    last_rx = None
+    saved_timeout = ser.timeout
+    ser.timeout = 0.05  # Inter-character gap: read() returns soon after bytes stop
+    try:
+        while time.monotonic() < deadline:
+            chunk = ser.read(512)
+            if chunk:
+                buf += chunk
+                last_rx = time.monotonic()
+                if all(p.search(buf) for p in patterns):
+                    break
+            elif last_rx is not None and time.monotonic() - last_rx > idle_s:
+                break
+    finally:
+        ser.timeout = saved_timeout
+    return bytes(buf)
+
+
+def identify_sensor(port_name, log=print):
     """Connect to a port and identify what sensor is there"""
-    print(f"\n{'='*60}")
-    print(f"Testing {port_name}")
-    print('='*60)
+    log(f"\n{'='*60}")
+    log(f"Testing {port_name}")
+    log('='*60)
     
     try:
         ser = serial.Serial(
             port=port_name,
             baudrate=9600,
-            timeout=5,  # Longer timeout
+            timeout=1.0,
             xonxoff=False,
             rtscts=False,
             dsrdtr=False
         )
         
-        print(f"✓ Port opened")
+        set_low_latency(ser)
+        enlarge_rx_buffer(ser)
+        log(f"✓ Port opened")
         
         # Clear buffers
         ser.reset_input_buffer()
@@ -29,140 +140,123 @@ def identify_sensor(port_name):
         time.sleep(0.1)
         
         # Wake up sensor
-        print("Waking up sensor...")
-        for _ in range(5):
-            ser.write(b'\r\n')
-            time.sleep(0.2)
-        
-        ser.write(b'%')
-        time.sleep(0.5)
-        
-        # Clear wake-up response
-        ser.reset_input_buffer()
-        time.sleep(1.0)
-        
-        # Get Product Name
-        print("Requesting ProductName...")
-        ser.reset_input_buffer()
-        ser.write(b'$GET ProductName\r\n')
-        time.sleep(1.0)
+        log("Waking up sensor...")
+        ser.write(b'\r\n' * 5 + b'%')
         
-        product_response = ""
-        attempts = 0
-        while attempts < 5:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                product_response += chunk
-                time.sleep(0.2)
-            else:
-                if product_response:
-                    break
-                time.sleep(0.2)
-            attempts += 1
+        # Let the wake-up response finish; the reset below clears it in one go
+        time.sleep(1.3)
         
-        # Get Serial Number
-        print("Requesting SerialNumber...")
+        # Get Product Name and Serial Number in one pipelined request
+        log("Requesting ProductName and SerialNumber...")
         ser.reset_input_buffer()
-        time.sleep(0.3)
-        ser.write(b'$GET SerialNumber\r\n')
-        time.sleep(1.0)
-        
-        serial_response = ""
-        attempts = 0
-        while attempts < 5:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                serial_response += chunk
-                time.sleep(0.2)
-            else:
-                if serial_response:
-                    break
-                time.sleep(0.2)
-            attempts += 1
+        ser.write(b'$GET ProductName\r\n$GET SerialNumber\r\n')
+        response = _read_response(ser, (_PROD_RE, _SN_RE))
         
         ser.close()
         
         # Parse responses
-        product_name = "UNKNOWN"
-        serial_number = "UNKNOWN"
-        sensor_type = "UNKNOWN"
+        m = _PROD_RE.search(response)
+        product_name = m.group(1).decode('ascii', errors='ignore').strip() if m else "UNKNOWN"
+        m = _SN_RE.search(response)
+        serial_number = m.group(1).decode('ascii', errors='ignore').strip() if m else "UNKNOWN"
+        sensor_type = infer_sensor_type(product_name)
+        label = _TYPE_LABELS.get(sensor_type)
+        full_name = f"{label} {product_name} SN {serial_number}" if label else f"{product_name} SN {serial_number}"
         
-        if product_response:
-            for line in product_response.split('\n'):
-                if '=' in line:
-                    product_name = line.split('=')[1].strip()
-                    break
+        log(f"\n✓ IDENTIFIED:")
+        log(f"  Product: {product_name}")
+        log(f"  Serial#: {serial_number}")
+        log(f"  Type: {sensor_type}")
         
-        if serial_response:
-            for line in serial_response.split('\n'):
-                if '=' in line:
-                    serial_number = line.split('=')[1].strip()
-                    break
-        
-        # Identify sensor type
-        if '4117' in product_name:
-            sensor_type = "pressure"
-            full_name = f"Pressure Sensor {product_name} SN {serial_number}"
-        elif '4330' in product_name:
-            sensor_type = "oxygen"
-            full_name = f"Oxygen Optode {product_name} SN {serial_number}"
-        elif '5819' in product_name or '5990' in product_name:
-            sensor_type = "conductivity"
-            full_name = f"Conductivity Sensor {product_name} SN {serial_number}"
-        else:
-            full_name = f"{product_name} SN {serial_number}"
-        
-        print(f"\n✓ IDENTIFIED:")
-        print(f"  Product: {product_name}")
-        print(f"  Serial#: {serial_number}")
-        print(f"  Type: {sensor_type}")
-        
-        return {
-            'port': port_name,
-            'success': True,
-            'product_name': product_name,
-            'serial_number': serial_number,
-            'sensor_type': sensor_type,
-            'full_name': full_name
-        }
+        return SensorInfo(port_name, True, product_name, serial_number, sensor_type, full_name, "")
         
     except serial.SerialException as e:
-        print(f"✗ Port error: {e}")
-        return {'port': port_name, 'success': False, 'error': str(e)}
+        log(f"✗ Port error: {e}")
+        return SensorInfo.failed(port_name, str(e))
     except Exception as e:
-        print(f"✗ Error: {e}")
-        return {'port': port_name, 'success': False, 'error': str(e)}
+        log(f"✗ Error: {e}")
+        return SensorInfo.failed(port_name, str(e))
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Identify which Aanderaa sensor is on which COM port.")
+    parser.add_argument(
+        "--use-cache",
+        action="store_true",
+        help="Report remembered detections without probing those ports (faster, but stale after re-cabling)",
+    )
+    args = parser.parse_args(argv)
+    
     print("\n" + "="*60)
     print("AANDERAA SENSOR IDENTIFICATION TOOL")
     print("="*60)
     print("\nThis will identify which sensor is on which COM port")
     print("and show you the correct configuration.\n")
     
-    # Test your three ports
-    ports = ['COM3', 'COM4', 'COM5']
+    port_infos = find_candidate_ports()
+    if not port_infos:
+        print("✗ No serial ports found!")
+        print("\nPossible issues:")
+        print("  - USB-to-Serial adapter not connected")
+        print("  - Adapter drivers not installed")
+        return
+    
+    # Earlier detections are only trusted on request: the point of this tool is to
+    # find out what is plugged in now
+    cache = load_detection_cache()
+    keys = {p.device: usb_port_key(p) for p in port_infos}
+    cached = {} if not args.use_cache else {
+        device: _from_cache(device, cache[key])
+        for device, key in keys.items()
+        if key in cache
+    }
+    ports = [p.device for p in port_infos if p.device not in cached]
+    
+    for r in cached.values():
+        print(f"{r.port}: {r.full_name} (remembered, not probed)")
+    
+    probed = []
+    if ports:
+        print(f"Probing: {', '.join(ports)}")
+        # Ports are independent devices, so probe them concurrently
+        # (each thread owns its own serial.Serial instance)
+        probed = run_per_port(ports, identify_sensor)
+    
+    # Remember successes, forget ports that now fail
+    for r in probed:
+        key = keys.get(r.port)
+        if not key:
+            continue
+        if r.success and r.product_name != "UNKNOWN":
+            cache[key] = {
+                'baudrate': 9600,
+                'product_name': r.product_name,
+                'serial_number': r.serial_number,
+                'sensor_type': r.sensor_type,
+                'full_name': r.full_name,
+            }
+        else:
+            cache.pop(key, None)
+    if probed:
+        try:
+            save_detection_cache(cache)
+        except OSError as e:
+            print(f"Note: could not save detection cache: {e}")
     
-    results = []
-    for port in ports:
-        result = identify_sensor(port)
-        results.append(result)
-        time.sleep(0.5)
+    results = sorted(list(cached.values()) + probed, key=lambda r: r.port)
     
     # Summary
     print("\n\n" + "="*60)
     print("IDENTIFICATION SUMMARY")
     print("="*60 + "\n")
     
-    detected = [r for r in results if r.get('success')]
+    detected = [r for r in results if r.success]
     
     if detected:
-        print(f"✓ Found {len(detected)} sensor(s):\n")
+        lines = [f"✓ Found {len(detected)} sensor(s):\n"]
         for r in detected:
-            print(f"{r['port']}: {r['full_name']}")
-            print(f"         Type = '{r['sensor_type']}'")
-            print()
+            lines += [f"{r.port}: {r.full_name}", f"         Type = '{r.sensor_type}'", ""]
+        sys.stdout.write("\n".join(lines) + "\n")
     else:
         print("✗ No sensors detected!")
         print("\nPossible issues:")
@@ -176,21 +270,19 @@ def main():
     print("CORRECT sensor_config.json")
     print("="*60 + "\n")
     
-    print("{")
-    print('  "sensors": [')
-    
-    for i, sensor in enumerate(detected):
-        comma = "," if i < len(detected) - 1 else ""
-        print('    {')
-        print(f'      "name": "{sensor["full_name"]}",')
-        print(f'      "com_port": "{sensor["port"]}",')
-        print(f'      "baudrate": 9600,')
-        print(f'      "sensor_type": "{sensor["sensor_type"]}",')
-        print(f'      "timeout": 5')
-        print(f'    }}{comma}')
-    
-    print('  ]')
-    print('}')
+    config = {
+        'sensors': [
+            {
+                'name': r.full_name,
+                'com_port': r.port,
+                'baudrate': 9600,
+                'sensor_type': r.sensor_type,
+                'timeout': 5,
+            }
+            for r in detected
+        ]
+    }
+    print(json.dumps(config, indent=2))
     
     print("\n" + "="*60)
     print("ACTION REQUIRED:")
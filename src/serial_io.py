@@ -0,0 +1,128 @@
+"""Port-name, request/reply and per-port concurrency helpers shared by the sensor scripts.
+
+Both helpers wait inside ``ser.read`` (which returns as soon as a byte
+arrives) rather than sleep-polling ``in_waiting``, and accumulate into a
+``bytearray``. They return raw bytes; callers decode only what they need.
+The port's own timeout is restored before returning.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, TypeVar
+
+import serial
+
+T = TypeVar("T")
+
+
+def normalize_port(port: object) -> str:
+    """Upper-case COM names and expand bare numbers ("12" -> "COM12"); leave device paths alone."""
+    name = str(port).strip()
+    if name.isdigit():
+        return "COM" + name
+    if name.upper().startswith("COM"):
+        return name.upper()
+    return name
+
+
+def unique_ports(ports: Iterable[object]) -> List[str]:
+    """Normalise and de-duplicate, dropping blanks and keeping first-seen order."""
+    return list(dict.fromkeys(normalize_port(p) for p in ports if p and str(p).strip()))
+
+
+def query(
+    ser: serial.Serial,
+    cmd: bytes,
+    max_wait: float = 1.0,
+    quiet: float = 0.05,
+    until: Optional[Callable[[bytearray], bool]] = None,
+) -> bytes:
+    """Send ``cmd`` and return the reply once the line has been quiet for ``quiet`` s.
+
+    With ``until``, the reply also ends as soon as ``until(buf)`` is true (e.g.
+    once every expected ack is in). Stale input is purged first only if there
+    is any. Gives up after ``max_wait`` s.
+    """
+    if ser.in_waiting:
+        ser.reset_input_buffer()
+    ser.write(cmd)
+    deadline = time.monotonic() + max_wait
+    buf = bytearray()
+    timeout, ser.timeout = ser.timeout, quiet
+    try:
+        while time.monotonic() < deadline:
+            # An empty read means `quiet` s of silence
+            chunk = ser.read(ser.in_waiting or 1)
+            if chunk:
+                buf += chunk
+                if until is not None and until(buf):
+                    break
+            elif buf:
+                break
+    finally:
+        ser.timeout = timeout
+    return bytes(buf)
+
+
+def collect_until(
+    ser: serial.Serial, predicate: Callable[[bytearray], bool], deadline_s: float, poll_s: float = 0.05
+) -> bytes:
+    """Read whatever arrives for up to ``deadline_s`` s, returning early once ``predicate(buf)`` is true."""
+    deadline = time.monotonic() + deadline_s
+    buf = bytearray()
+    timeout, ser.timeout = ser.timeout, poll_s
+    try:
+        while time.monotonic() < deadline:
+            chunk = ser.read(ser.in_waiting or 1)
+            if chunk:
+                buf += chunk
+                if predicate(buf):
+                    break
+    finally:
+        ser.timeout = timeout
+    return bytes(buf)
+
+
+def run_per_port(
+    ports: Iterable[str],
+    fn: Callable[[str, Callable[[str], None]], T],
+    *,
+    live: bool = False,
+    max_workers: Optional[int] = None,
+) -> List[T]:
+    """Run ``fn(port, log)`` for every port concurrently; results come back in port order.
+
+    Each port is its own serial line, so the calls are independent. By default
+    every port's ``log`` lines are collected and printed as one block once that
+    port finishes, so reports from different ports do not interleave. With
+    ``live`` each line is printed as soon as it is logged, prefixed with
+    ``[port]``; use it for slow steps (flash writes, reboots) where a silent
+    console would look like a hang.
+    """
+    ports = list(ports)
+    if not ports:
+        return []
+    print_lock = threading.Lock()
+
+    def _run(port: str) -> T:
+        if live:
+            def log(text: str) -> None:
+                prefixed = "\n".join(f"[{port}] {line}".rstrip() for line in str(text).split("\n"))
+                with print_lock:
+                    print(prefixed, flush=True)
+
+            return fn(port, log)
+
+        lines: List[str] = []
+        try:
+            return fn(port, lines.append)
+        finally:
+            if lines:
+                with print_lock:
+                    print("\n".join(lines), flush=True)
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(ports)) as ex:
+        return list(ex.map(_run, ports))
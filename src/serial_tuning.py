@@ -0,0 +1,66 @@
+"""Best-effort tuning of USB-serial adapters used with the Aanderaa sensors.
+
+FTDI adapters hold small replies in their buffer for up to ``latency_timer``
+milliseconds (16 ms by default) before handing them to the host. The command
+round-trips used here are tiny, so lowering the timer to 1 ms removes most of
+that idle time.
+
+All helpers are best-effort: they return False instead of raising when the
+adapter is not an FTDI device or the process lacks the rights to change it.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+import serial
+
+
+def _set_latency_linux(device: str, ms: int) -> bool:
+    name = Path(os.path.realpath(device)).name  # e.g. /dev/serial/by-id/... -> ttyUSB0
+    sysfs = Path("/sys/bus/usb-serial/devices") / name / "latency_timer"
+    try:
+        sysfs.write_text(str(ms))
+        return True
+    except OSError:
+        return False
+
+
+def set_low_latency(ser: serial.Serial, ms: int = 1) -> bool:
+    """Lower the FTDI latency timer for the port behind ``ser``.
+
+    On Linux the sysfs value applies immediately; if it cannot be written the
+    kernel's ASYNC_LOW_LATENCY flag is tried instead. Elsewhere this is a
+    no-op: on Windows the timer is a driver setting (Device Manager > Port
+    Settings > Advanced) that only takes effect when the port is reopened.
+    """
+    device = ser.port or ""
+    if not device:
+        return False
+
+    if sys.platform.startswith("linux"):
+        if _set_latency_linux(device, ms):
+            return True
+        try:
+            ser.set_low_latency_mode(True)
+            return True
+        except (AttributeError, ValueError, OSError):
+            return False
+
+    return False
+
+
+def enlarge_rx_buffer(ser: serial.Serial, rx_size: int = 65536, tx_size: int = 4096) -> bool:
+    """Grow the Windows driver RX buffer so long replies (e.g. HELP) are not dropped.
+
+    pyserial only supports ``set_buffer_size`` on Windows; elsewhere this is a no-op.
+    """
+    if os.name != "nt":
+        return False
+    try:
+        ser.set_buffer_size(rx_size=rx_size, tx_size=tx_size)
+        return True
+    except (AttributeError, ValueError, serial.SerialException):
+        return False
@@ -20,7 +20,11 @@ import re
 import serial
 import time
 from pathlib import Path
-from typing import List, Optional, Literal, Tuple
+from typing import Callable, Dict, List, Optional, Literal, Tuple
+
+from config_manager import load_state, save_state
+from serial_io import run_per_port, unique_ports
+from serial_tuning import set_low_latency
 
 
 def load_ports_from_config(config_path: Path) -> List[str]:
@@ -29,63 +33,101 @@ def load_ports_from_config(config_path: Path) -> List[str]:
         with config_path.open("r", encoding="utf-8") as f:
             config = json.load(f)
         
-        ports = []
-        for sensor in config.get("sensors", []):
-            port = sensor.get("com_port", "")
-            if port:
-                ports.append(str(port).upper())
-        
-        return ports
+        return unique_ports(sensor.get("com_port", "") for sensor in config.get("sensors", []))
     except Exception as e:
         print(f"Error loading config: {e}")
         return []
 
 
-def send_command(ser: serial.Serial, command: str, wait_s: float = 1.0) -> str:
-    """Send a command and return the response (best-effort)."""
+_FLOAT_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\d*\.?\d+)(?:[Ee][-+]?\d+)?")
+# "Syntax error", "Argument error" and "*\tERROR" replies all contain ERROR.
+_ERROR_RE = re.compile(r"ERROR", re.IGNORECASE)
+# Both markers may appear in either order, hence the lookaheads.
+_FW2_RE = re.compile(r"(?=.*RESULT)(?=.*=)", re.IGNORECASE | re.DOTALL)
+_FW3_RE = re.compile(r"(?=.*\t)(?=.*PRODUCT)", re.IGNORECASE | re.DOTALL)
+
+# Prompt characters that may close a reply.
+_PROMPT_ENDINGS = (b"#", b">")
+# Both dialects acknowledge Get/Set/Save with '#' (configure_streaming_mode relies on
+# the same ack for FW3 "Set ...(...)"/"Save"), so it is the delimiter to block on.
+_ACK = b"#"
+
+
+def send_command(
+    ser: serial.Serial,
+    command: str,
+    wait_s: float = 1.0,
+    *,
+    expected_terminator: Optional[bytes] = None,
+    quiesce_s: float = 0.1,
+) -> str:
+    """Send a command and return the response (best-effort).
+
+    With ``expected_terminator`` the read blocks in the driver until that
+    delimiter arrives (at most ``wait_s``); if nothing at all arrived by then,
+    it returns empty straight away. Otherwise, or if only part of a reply came,
+    the reply ends once the line has been quiet for ``quiesce_s`` after a
+    prompt, or 0.3 s after any other data.
+    """
     ser.reset_input_buffer()
-    ser.write((command + "\r\n").encode("ascii", errors="ignore"))
-    time.sleep(wait_s)
-
-    # Drain for a little while to catch multi-line responses.
-    end = time.time() + max(0.2, wait_s)
-    chunks: List[str] = []
-    while time.time() < end:
-        waiting = 0
-        try:
-            waiting = ser.in_waiting
-        except Exception:
-            waiting = 0
-        if waiting:
-            chunks.append(ser.read(waiting).decode("ascii", errors="ignore"))
-            end = time.time() + 0.3
-        else:
-            time.sleep(0.05)
+    ser.write(f"{command}\r\n".encode("ascii", errors="ignore"))
 
-    return "".join(chunks)
+    prev_timeout = ser.timeout
+    buf = bytearray()
+    start = time.monotonic()
+    give_up = start + wait_s + max(0.2, wait_s)
+    try:
+        if expected_terminator:
+            ser.timeout = wait_s
+            buf += ser.read_until(expected_terminator, 4096)
+            if buf.endswith(expected_terminator):
+                buf += ser.read(ser.in_waiting)
+                return buf.decode("ascii", errors="ignore")
+            if not buf:
+                # read_until already waited the full wait_s in silence
+                return ""
+
+        ser.timeout = 0.05
+        last_rx = time.monotonic()
+        while True:
+            chunk = ser.read(ser.in_waiting or 1)
+            now = time.monotonic()
+            if chunk:
+                buf += chunk
+                last_rx = now
+                continue
+            if not buf:
+                if now >= give_up:
+                    break
+                continue
+            idle = now - last_rx
+            if idle >= 0.3 or (idle >= quiesce_s and buf.rstrip().endswith(_PROMPT_ENDINGS)):
+                break
+    finally:
+        ser.timeout = prev_timeout
+
+    return buf.decode("ascii", errors="ignore")
 
 
 def _is_error_response(text: str) -> bool:
-    t = (text or "").upper()
-    return any(k in t for k in ["SYNTAX ERROR", "ARGUMENT ERROR", "*\tERROR", "*   ERROR", "ERROR"])
+    return bool(text) and _ERROR_RE.search(text) is not None
 
 
 def _looks_like_fw2(text: str) -> bool:
     # FW2-ish responses in this repo are parsed as: "RESULT GET Property=Value"
-    t = (text or "").upper()
-    return "RESULT" in t and "=" in t
+    return bool(text) and _FW2_RE.match(text) is not None
 
 
 def _looks_like_fw3(text: str) -> bool:
     # FW3 Smart Sensor Terminal often returns tab-delimited lines starting with property name.
-    return ("\t" in (text or "")) and ("PRODUCT" in (text or "").upper())
+    return bool(text) and _FW3_RE.match(text) is not None
 
 
 def _extract_last_float(text: str) -> Optional[float]:
     """Extract the last float-looking number from a response."""
     if not text:
         return None
-    matches = re.findall(r"[-+]?(?:\d+\.?\d*|\d*\.?\d+)(?:[Ee][-+]?\d+)?", text)
+    matches = _FLOAT_RE.findall(text)
     if not matches:
         return None
     try:
@@ -96,23 +138,43 @@ def _extract_last_float(text: str) -> Optional[float]:
 
 Protocol = Literal["fw2", "fw3"]
 
+# Dialect detected per port during this run. Only used to order the detection probes
+# (the sensor on a port can be swapped), and dropped when a command on that port fails.
+_PROTOCOL_CACHE: Dict[str, Protocol] = {}
+
+# Command forms per dialect. FW2 in this repo uses "$SET Name Value" (space
+# separated); FW3 uses "Set Name(Value)".
+_GET_FORMAT: Dict[Protocol, str] = {"fw2": "$GET {}", "fw3": "Get {}"}
+_SET_FORMAT: Dict[Protocol, str] = {"fw2": "$SET {} {}", "fw3": "Set {}({})"}
+_SAVE_CMD: Dict[Protocol, str] = {"fw2": "$SAVE", "fw3": "Save"}
+_RESET_CMD: Dict[Protocol, str] = {"fw2": "$RESET", "fw3": "Reset"}
 
-def detect_protocol(ser: serial.Serial) -> Tuple[Optional[Protocol], str]:
-    """Try to detect which command dialect the sensor speaks."""
+# Passkey command form that the last sensor of each dialect accepted.
+_PASSKEY_WORKING_CMD: Dict[Protocol, str] = {}
+
+
+def detect_protocol(ser: serial.Serial, prefer: Optional[Protocol] = None) -> Tuple[Optional[Protocol], str]:
+    """Try to detect which command dialect the sensor speaks.
+
+    Probes for ``prefer`` (e.g. the dialect seen on this port last time) go first.
+    """
     probes = [
         ("fw2", "$GET ProductName"),
         ("fw3", "Get ProductName"),
         ("fw3", "Help"),
         ("fw3", "HELP"),
     ]
+    if prefer:
+        probes.sort(key=lambda probe: probe[0] != prefer)
     last = ""
     for proto, cmd in probes:
         resp = send_command(ser, cmd, wait_s=1.2)
         last = resp
         if resp and not _is_error_response(resp):
-            if proto == "fw2" and _looks_like_fw2(resp):
+            # A reply in either dialect settles it, whichever probe triggered it.
+            if _looks_like_fw2(resp):
                 return "fw2", resp
-            if proto == "fw3":
+            if proto == "fw3" or _looks_like_fw3(resp):
                 return "fw3", resp
     return None, last
 
@@ -121,22 +183,34 @@ def _wake_sensor(ser: serial.Serial) -> None:
     ser.reset_input_buffer()
     ser.reset_output_buffer()
     time.sleep(0.1)
-    for _ in range(5):
-        ser.write(b"\r\n")
-        time.sleep(0.1)
     # Many setups use '%' as wake; harmless if not needed.
-    ser.write(b"%")
+    ser.write(b"\r\n" * 5 + b"%")
     time.sleep(0.4)
     ser.reset_input_buffer()
     time.sleep(0.2)
 
 
+def _ensure_awake(ser: serial.Serial, probe_s: float = 0.1) -> None:
+    """Wake the sensor only if a bare CRLF does not already get a prompt back."""
+    ser.reset_input_buffer()
+    ser.write(b"\r\n")
+    prev_timeout = ser.timeout
+    ser.timeout = probe_s
+    try:
+        data = ser.read(64)
+        data += ser.read(ser.in_waiting)
+    finally:
+        ser.timeout = prev_timeout
+    if any(p in data for p in _PROMPT_ENDINGS):
+        ser.reset_input_buffer()
+        return
+    _wake_sensor(ser)
+
+
 def _stop_streaming(ser: serial.Serial, protocol: Protocol) -> None:
     # Best effort: try Stop command in both dialects.
     if protocol == "fw2":
-        ser.write(b"$STOP\r\n")
-        time.sleep(0.2)
-        ser.write(b"STOP\r\n")
+        ser.write(b"$STOP\r\nSTOP\r\n")
     else:
         ser.write(b"Stop\r\n")
     time.sleep(0.4)
@@ -144,18 +218,12 @@ def _stop_streaming(ser: serial.Serial, protocol: Protocol) -> None:
 
 
 def _get_property(ser: serial.Serial, protocol: Protocol, prop: str) -> str:
-    cmd = f"$GET {prop}" if protocol == "fw2" else f"Get {prop}"
-    return send_command(ser, cmd, wait_s=1.2)
+    return send_command(ser, _GET_FORMAT[protocol].format(prop), wait_s=1.2, expected_terminator=_ACK)
 
 
 def _set_property(ser: serial.Serial, protocol: Protocol, prop: str, value: str, *, wait_s: float = 1.0) -> str:
-    # FW2 in this repo commonly uses "$SET Name Value" (space separated)
-    # FW3 uses "Set Name(Value)".
-    if protocol == "fw2":
-        cmd = f"$SET {prop} {value}"
-        return send_command(ser, cmd, wait_s=wait_s)
-    cmd = f"Set {prop}({value})"
-    return send_command(ser, cmd, wait_s=wait_s)
+    cmd = _SET_FORMAT[protocol].format(prop, value)
+    return send_command(ser, cmd, wait_s=wait_s, expected_terminator=_ACK)
 
 
 def _try_set_passkey(ser: serial.Serial, protocol: Protocol) -> Tuple[bool, str]:
@@ -180,28 +248,39 @@ def _try_set_passkey(ser: serial.Serial, protocol: Protocol) -> Tuple[bool, str]
             "Set Passkey 1000",
         ]
 
+    # Sensors in one setup share a firmware, so lead with the form that already worked.
+    known = _PASSKEY_WORKING_CMD.get(protocol)
+    if known:
+        candidates = [known] + [c for c in candidates if c != known]
+
     last = ""
     for cmd in candidates:
-        resp = send_command(ser, cmd, wait_s=1.2)
+        # Passkey replies are short; the prompt usually comes back well within this.
+        resp = send_command(ser, cmd, wait_s=0.4)
         last = resp
         # Success can be empty (some firmwares only respond with '#') so the only hard signal
         # we can rely on is that it is NOT an error.
         if resp and _is_error_response(resp):
             continue
+        _PASSKEY_WORKING_CMD[protocol] = cmd
         return True, resp
     return False, last
 
 
+def _save(ser: serial.Serial, protocol: Protocol) -> str:
+    return send_command(ser, _SAVE_CMD[protocol], wait_s=6.0, expected_terminator=_ACK)
+
+
 def _save_and_reset(ser: serial.Serial, protocol: Protocol, do_reset: bool) -> Tuple[str, str]:
-    save_cmd = "$SAVE" if protocol == "fw2" else "Save"
-    save_resp = send_command(ser, save_cmd, wait_s=6.0)
-    reset_resp = ""
-    if do_reset:
-        reset_cmd = "$RESET" if protocol == "fw2" else "Reset"
-        reset_resp = send_command(ser, reset_cmd, wait_s=1.0)
+    save_resp = _save(ser, protocol)
+    reset_resp = _reset(ser, protocol) if do_reset else ""
     return save_resp, reset_resp
 
 
+def _reset(ser: serial.Serial, protocol: Protocol) -> str:
+    return send_command(ser, _RESET_CMD[protocol], wait_s=1.0)
+
+
 def _set_mode_terminal(ser: serial.Serial, protocol: Protocol) -> bool:
     """Best-effort: set Mode to Smart Sensor Terminal."""
     candidates: List[str]
@@ -227,184 +306,240 @@ def _set_mode_terminal(ser: serial.Serial, protocol: Protocol) -> bool:
     return False
 
 
+def _open_port(port: str) -> serial.Serial:
+    ser = serial.Serial(
+        port=port,
+        baudrate=9600,
+        bytesize=8,
+        parity="N",
+        stopbits=1,
+        timeout=0.05,
+        # Most of the working debug tools in this repo use xonxoff=False.
+        xonxoff=False,
+        rtscts=False,
+        dsrdtr=False,
+    )
+    # Each get/set is a tiny round-trip; don't let the FTDI chip sit on replies for 16 ms.
+    set_low_latency(ser)
+    return ser
+
+
+def wait_for_boot(port: str, max_wait: float = 5.0, poll_s: float = 0.25) -> bool:
+    """Poll a rebooting sensor with CRLF until it echoes anything printable."""
+    end = time.monotonic() + max_wait
+    while time.monotonic() < end:
+        try:
+            with serial.Serial(port, 9600, timeout=poll_s) as probe:
+                while time.monotonic() < end:
+                    probe.write(b"\r\n")
+                    data = probe.read(probe.in_waiting or 1)
+                    if any(32 <= b < 127 for b in data):
+                        return True
+        except serial.SerialException:
+            # The port can briefly disappear while the sensor restarts.
+            time.sleep(poll_s)
+    return False
+
+
 def configure_sensor_interval(
     port: str,
     interval_s: float,
     *,
     do_reset: bool = True,
     force_terminal_mode: bool = False,
+    verify_after_reset: bool = False,
+    verbose: bool = False,
+    protocol: Optional[Protocol] = None,
+    protocol_hint: Optional[Protocol] = None,
+    log: Callable[[str], None] = print,
 ) -> bool:
-    """Configure a single sensor's interval"""
-    print(f"\n{'='*60}")
-    print(f"Configuring {port}")
-    print('='*60)
+    """Configure a single sensor's interval.
+
+    The new Interval is read back on the same connection before Save; pass
+    ``verify_after_reset`` to instead reopen the port and check it after the
+    sensor has rebooted. ``verbose`` also reports the current Mode and Interval
+    before changing anything (always done with ``force_terminal_mode``).
+
+    ``protocol`` skips dialect detection entirely; ``protocol_hint`` only
+    decides which dialect is probed first.
+
+    Progress lines go through ``log`` so callers running several ports at once
+    can collect them per port instead of interleaving on stdout.
+    """
+    log(f"\n{'='*60}")
+    log(f"Configuring {port}")
+    log('='*60)
     
     try:
         # Open serial connection
-        print(f"Opening {port}...")
-        ser = serial.Serial(
-            port=port,
-            baudrate=9600,
-            bytesize=8,
-            parity="N",
-            stopbits=1,
-            timeout=2.0,
-            # Most of the working debug tools in this repo use xonxoff=False.
-            xonxoff=False,
-            rtscts=False,
-            dsrdtr=False,
-        )
+        log(f"Opening {port}...")
+        ser = _open_port(port)
         
-        print("✓ Port opened")
+        log("✓ Port opened")
         
-        _wake_sensor(ser)
-
-        protocol, probe_resp = detect_protocol(ser)
-        if not protocol:
-            print("✗ Could not determine command protocol")
-            print(f"  Last response: {probe_resp[:120] if probe_resp else 'empty'}")
-            print("  Next step: run debug tool: python src/debug_sensor_responses.py")
-            ser.close()
-            return False
+        _ensure_awake(ser)
 
-        print(f"✓ Detected protocol: {protocol}")
+        if protocol:
+            log(f"✓ Protocol (given): {protocol}")
+        else:
+            # The dialect seen on this port earlier is probed first, so a correct
+            # guess costs a single round-trip and a swapped sensor is still detected.
+            protocol, probe_resp = detect_protocol(ser, prefer=_PROTOCOL_CACHE.get(port) or protocol_hint)
+            if not protocol:
+                _PROTOCOL_CACHE.pop(port, None)
+                log("✗ Could not determine command protocol")
+                log(f"  Last response: {probe_resp[:120] if probe_resp else 'empty'}")
+                log("  Next step: run debug tool: python src/debug_sensor_responses.py")
+                ser.close()
+                return False
+            _PROTOCOL_CACHE[port] = protocol
+            log(f"✓ Detected protocol: {protocol}")
 
         # If the sensor is streaming, Stop often helps.
-        print("Stopping any active streaming...")
+        log("Stopping any active streaming...")
         _stop_streaming(ser, protocol)
-        _wake_sensor(ser)
+        _ensure_awake(ser)
 
         # Some properties are writable only after Passkey(1), but Interval is often NOT protected.
         # So we try Passkey, but we don't fail hard if the device rejects it.
-        print("Setting Passkey (try 1 / 1000)...")
+        log("Setting Passkey (try 1 / 1000)...")
         passkey_ok, passkey_resp = _try_set_passkey(ser, protocol)
         if passkey_resp:
             if passkey_ok:
-                print("✓ Passkey accepted")
+                log("✓ Passkey accepted")
             else:
-                print("⚠ Passkey rejected")
-                print(f"  Response: {passkey_resp.strip()[:200]}")
+                log("⚠ Passkey rejected")
+                log(f"  Response: {passkey_resp.strip()[:200]}")
         else:
             if passkey_ok:
-                print("✓ Passkey sent (no response)")
+                log("✓ Passkey sent (no response)")
             else:
-                print("⚠ Passkey failed (no response)")
-
-        # Print current Mode/Interval for diagnostics.
-        mode_before = _get_property(ser, protocol, "Mode")
-        if mode_before and _is_error_response(mode_before):
-            # Some sensors/firmware variants expose the same concept under different property names
-            # or only in some modes.
-            for alt in ["Output", "Interface", "Protocol"]:
-                alt_resp = _get_property(ser, protocol, alt)
-                if alt_resp and not _is_error_response(alt_resp):
-                    mode_before = alt_resp
-                    break
-
-        interval_before = _get_property(ser, protocol, "Interval")
-        if mode_before:
-            print(f"Current Mode response: {mode_before.strip()[:120]}")
-        if interval_before:
-            print(f"Current Interval response: {interval_before.strip()[:120]}")
+                log("⚠ Passkey failed (no response)")
+
+        # Current Mode/Interval are diagnostics only; each read is a full round-trip.
+        if verbose or force_terminal_mode:
+            mode_before = _get_property(ser, protocol, "Mode")
+            if mode_before and _is_error_response(mode_before):
+                # Some sensors/firmware variants expose the same concept under different property names
+                # or only in some modes.
+                for alt in ["Output", "Interface", "Protocol"]:
+                    alt_resp = _get_property(ser, protocol, alt)
+                    if alt_resp and not _is_error_response(alt_resp):
+                        mode_before = alt_resp
+                        break
+
+            interval_before = _get_property(ser, protocol, "Interval")
+            if mode_before:
+                log(f"Current Mode response: {mode_before.strip()[:120]}")
+            if interval_before:
+                log(f"Current Interval response: {interval_before.strip()[:120]}")
 
         if force_terminal_mode:
-            print("Forcing Mode=Smart Sensor Terminal...")
+            log("Forcing Mode=Smart Sensor Terminal...")
             ok = _set_mode_terminal(ser, protocol)
             if not ok:
-                print("⚠ Could not set Mode to Smart Sensor Terminal")
-                print("  Continuing anyway (Mode change is optional for changing Interval).")
+                log("⚠ Could not set Mode to Smart Sensor Terminal")
+                log("  Continuing anyway (Mode change is optional for changing Interval).")
                 # Do not fail hard here; many setups simply don't expose Mode over this interface.
             else:
                 save_resp, _ = _save_and_reset(ser, protocol, do_reset=True)
                 if save_resp and _is_error_response(save_resp):
-                    print("⚠ Save failed while changing Mode")
-                    print(f"  Response: {save_resp.strip()[:200]}")
+                    log("⚠ Save failed while changing Mode")
+                    log(f"  Response: {save_resp.strip()[:200]}")
                 time.sleep(1.0)
-                _wake_sensor(ser)
+                _ensure_awake(ser)
                 mode_after = _get_property(ser, protocol, "Mode")
                 if mode_after:
-                    print(f"Mode after: {mode_after.strip()[:120]}")
+                    log(f"Mode after: {mode_after.strip()[:120]}")
 
-        print(f"Setting Interval={interval_s}...")
+        log(f"Setting Interval={interval_s}...")
         set_interval_resp = _set_property(ser, protocol, "Interval", str(interval_s), wait_s=1.2)
         if set_interval_resp and _is_error_response(set_interval_resp):
-            print("✗ Interval rejected")
-            print(f"  Response: {set_interval_resp.strip()[:200]}")
+            log("✗ Interval rejected")
+            log(f"  Response: {set_interval_resp.strip()[:200]}")
+            # Possibly the wrong dialect for whatever is on this port now
+            _PROTOCOL_CACHE.pop(port, None)
             ser.close()
             return False
 
-        print("Disabling polled mode (Enable Polled Mode=no)...")
+        log("Disabling polled mode (Enable Polled Mode=no)...")
         polled_resp = _set_property(ser, protocol, "Enable Polled Mode", "no", wait_s=1.2)
         if polled_resp and _is_error_response(polled_resp):
-            print("⚠ Warning: could not change polled mode")
-            print(f"  Response: {polled_resp.strip()[:200]}")
+            log("⚠ Warning: could not change polled mode")
+            log(f"  Response: {polled_resp.strip()[:200]}")
 
-        print("Saving to flash...")
-        save_resp, reset_resp = _save_and_reset(ser, protocol, do_reset)
+        log("Saving to flash...")
+        save_resp = _save(ser, protocol)
         if save_resp and _is_error_response(save_resp):
-            print("✗ Save failed")
-            print(f"  Response: {save_resp.strip()[:200]}")
+            log("✗ Save failed")
+            log(f"  Response: {save_resp.strip()[:200]}")
+            _PROTOCOL_CACHE.pop(port, None)
             ser.close()
             return False
 
-        # Re-read interval to confirm (best-effort but we try to be robust):
-        # After Reset, the device may reboot and/or start streaming again.
+        interval_after_txt = ""
+        if not verify_after_reset:
+            # Read back on this handle before resetting; avoids reopening the port
+            # and re-synchronising with a rebooting sensor.
+            interval_after_txt = _get_property(ser, protocol, "Interval")
+
+        if do_reset:
+            _reset(ser, protocol)
+
         ser.close()
-        time.sleep(0.5)
 
-        interval_after_txt = ""
+        if verify_after_reset:
+            # Re-read interval to confirm (best-effort but we try to be robust):
+            # After Reset, the device may reboot and/or start streaming again.
+            time.sleep(0.5)
+            try:
+                if do_reset and not wait_for_boot(port):
+                    log("⚠ Sensor did not answer within 5s of reset; verifying anyway")
+
+                verify_ser = _open_port(port)
+                _ensure_awake(verify_ser)
+                if force_terminal_mode:
+                    # Changing Mode can change the dialect after the reset.
+                    verify_protocol, _ = detect_protocol(verify_ser)
+                    if verify_protocol:
+                        protocol = verify_protocol
+                        _PROTOCOL_CACHE[port] = protocol
+                _stop_streaming(verify_ser, protocol)
+                _ensure_awake(verify_ser)
+
+                interval_after_txt = _get_property(verify_ser, protocol, "Interval")
+                verify_ser.close()
+            except Exception as e:
+                log(f"⚠ Warning: could not verify Interval after save/reset: {e}")
+
         interval_after_val: Optional[float] = None
-        try:
-            if do_reset:
-                time.sleep(3.0)
-
-            verify_ser = serial.Serial(
-                port=port,
-                baudrate=9600,
-                bytesize=8,
-                parity="N",
-                stopbits=1,
-                timeout=2.0,
-                xonxoff=False,
-                rtscts=False,
-                dsrdtr=False,
-            )
-            _wake_sensor(verify_ser)
-            verify_protocol, _ = detect_protocol(verify_ser)
-            if verify_protocol:
-                protocol = verify_protocol
-            _stop_streaming(verify_ser, protocol)
-            _wake_sensor(verify_ser)
-
-            interval_after_txt = _get_property(verify_ser, protocol, "Interval")
-            if interval_after_txt:
-                print(f"Interval after: {interval_after_txt.strip()[:120]}")
-                if not _is_error_response(interval_after_txt):
-                    interval_after_val = _extract_last_float(interval_after_txt)
-            verify_ser.close()
-        except Exception as e:
-            print(f"⚠ Warning: could not verify Interval after save/reset: {e}")
+        if interval_after_txt:
+            log(f"Interval after: {interval_after_txt.strip()[:120]}")
+            if not _is_error_response(interval_after_txt):
+                interval_after_val = _extract_last_float(interval_after_txt)
 
         if interval_after_txt and _is_error_response(interval_after_txt):
-            print("⚠ Warning: sensor responded with SYNTAX ERROR when verifying Interval")
-            print("  The interval may still have been applied; confirm by observing data rate.")
+            log("⚠ Warning: sensor responded with SYNTAX ERROR when verifying Interval")
+            log("  The interval may still have been applied; confirm by observing data rate.")
         elif interval_after_val is not None:
             if abs(interval_after_val - float(interval_s)) > 1e-6:
-                print(f"✗ Interval verify mismatch: expected {interval_s}, got {interval_after_val}")
-                print("  Configuration may not have applied. Try again with --force-terminal-mode or --no-reset.")
+                log(f"✗ Interval verify mismatch: expected {interval_s}, got {interval_after_val}")
+                log("  Configuration may not have applied. Try again with --force-terminal-mode or --no-reset.")
                 return False
         
-        print(f"\n{'='*60}")
-        print(f"✓ SUCCESS: {port} configured to {interval_s}s interval")
-        print('='*60)
+        log(f"\n{'='*60}")
+        log(f"✓ SUCCESS: {port} configured to {interval_s}s interval")
+        log('='*60)
         
         return True
         
     except serial.SerialException as e:
-        print(f"✗ Serial port error: {e}")
+        log(f"✗ Serial port error: {e}")
+        _PROTOCOL_CACHE.pop(port, None)
         return False
     except Exception as e:
-        print(f"✗ Unexpected error: {e}")
+        log(f"✗ Unexpected error: {e}")
+        _PROTOCOL_CACHE.pop(port, None)
         return False
 
 
@@ -457,6 +592,25 @@ Notes:
         action="store_true",
         help="Attempt to set Mode=Smart Sensor Terminal before changing Interval (use if device is in AiCaP/AADI modes)",
     )
+
+    parser.add_argument(
+        "--verify-after-reset",
+        action="store_true",
+        help="Reopen the port after Save/Reset and read Interval back (slower; checks the saved value survived the reboot)",
+    )
+
+    parser.add_argument(
+        "--protocol",
+        choices=["fw2", "fw3"],
+        default=None,
+        help="Command dialect to use; skips protocol detection",
+    )
+
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Read and print the current Mode and Interval before changing them",
+    )
     
     args = parser.parse_args(argv)
     
@@ -465,11 +619,7 @@ Notes:
     
     if args.ports:
         # Use explicitly specified ports
-        for p in args.ports:
-            port = str(p).upper()
-            if not port.startswith("COM"):
-                port = "COM" + port
-            ports.append(port)
+        ports = unique_ports(args.ports)
     else:
         # Default: read from config file
         script_dir = Path(__file__).parent
@@ -490,6 +640,7 @@ Notes:
     interval_s = args.interval
     do_reset = not args.no_reset
     force_terminal_mode = bool(args.force_terminal_mode)
+    verify_after_reset = bool(args.verify_after_reset)
     
     if interval_s <= 0:
         print(f"Error: Interval must be positive (got {interval_s})")
@@ -503,14 +654,39 @@ Notes:
     print(f"Ports: {', '.join(ports)}")
     print(f"Reset after save: {'Yes' if do_reset else 'No'}")
     print(f"Force terminal mode: {'Yes' if force_terminal_mode else 'No'}")
+    print(f"Verify after reset: {'Yes' if verify_after_reset else 'No'}")
     print("="*60)
     
-    # Configure each sensor
-    success_count = 0
-    for port in ports:
-        if configure_sensor_interval(port, interval_s, do_reset=do_reset, force_terminal_mode=force_terminal_mode):
-            success_count += 1
-        time.sleep(1.0)  # Brief pause between sensors
+    # The dialect each port answered in last time is probed first.
+    state = load_state()
+    known_protocols = state.get("protocols", {})
+    if not isinstance(known_protocols, dict):
+        known_protocols = {}
+
+    def _configure(port: str, log: Callable[[str], None]) -> bool:
+        return configure_sensor_interval(
+            port,
+            interval_s,
+            do_reset=do_reset,
+            force_terminal_mode=force_terminal_mode,
+            verify_after_reset=verify_after_reset,
+            verbose=args.verbose,
+            protocol=args.protocol,
+            protocol_hint=known_protocols.get(port),
+            log=log,
+        )
+
+    # Save and reboot take seconds per sensor, so progress is printed as it happens.
+    success_count = sum(run_per_port(ports, _configure, live=True))
+
+    detected = {p: _PROTOCOL_CACHE[p] for p in ports if p in _PROTOCOL_CACHE}
+    if detected and not args.protocol:
+        known_protocols.update(detected)
+        state["protocols"] = known_protocols
+        try:
+            save_state(state)
+        except OSError as e:
+            print(f"⚠ Could not remember detected protocols: {e}")
     
     # Summary
     print("\n" + "="*60)
@@ -1,66 +1,67 @@
 """
 Switch Aanderaa Sensors from AADI Real-Time Mode to Smart Sensor Terminal Mode
 """
+import random
 import serial
 import time
 
-def try_xml_commands(port_name):
+from serial_io import run_per_port
+
+def try_xml_commands(port_name, log=print):
     """Test if sensor is in AADI Real-Time mode by trying XML commands"""
-    print(f"\n{'='*70}")
-    print(f"Testing {port_name} for AADI Real-Time Mode (XML)")
-    print('='*70)
+    log(f"\n{'='*70}")
+    log(f"Testing {port_name} for AADI Real-Time Mode (XML)")
+    log('='*70)
     
     try:
-        ser = serial.Serial(port_name, 9600, timeout=3)
-        print(f"✓ Port opened\n")
+        with serial.Serial(port_name, 9600, timeout=3) as ser:
+            log(f"✓ Port opened\n")
         
-        # Wake up
-        ser.write(b'\r\n')
-        time.sleep(0.5)
-        ser.reset_input_buffer()
+            # Wake up
+            ser.write(b'\r\n')
+            time.sleep(0.5)
+            ser.reset_input_buffer()
         
-        # Try XML command to get product info
-        print("[Test 1] Sending XML command: <Get><ProductName/></Get>")
-        ser.write(b'<Get><ProductName/></Get>\r\n')
-        time.sleep(1.5)
+            # Try XML command to get product info
+            log("[Test 1] Sending XML command: <Get><ProductName/></Get>")
+            ser.write(b'<Get><ProductName/></Get>\r\n')
+            time.sleep(1.5)
         
-        response = ""
-        attempts = 0
-        while attempts < 5:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                response += chunk
-                time.sleep(0.2)
-            else:
-                if response:
-                    break
-                time.sleep(0.2)
-            attempts += 1
+            response = ""
+            attempts = 0
+            while attempts < 5:
+                if ser.in_waiting > 0:
+                    chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+                    response += chunk
+                    time.sleep(0.2)
+                else:
+                    if response:
+                        break
+                    time.sleep(0.2)
+                attempts += 1
         
-        print(f"Response: {response[:200]}")
+            log(f"Response: {response[:200]}")
         
-        if '<Result>' in response or '<ProductName>' in response:
-            print("\n✓ CONFIRMED: Sensor is in AADI Real-Time mode (XML)")
-            print("  This explains the 'Syntax error' with ASCII commands!")
-            return True, response
-        else:
-            print("\n? Not sure - no XML response received")
-            return False, response
-        
-        ser.close()
+            if '<Result>' in response or '<ProductName>' in response:
+                log("\n✓ CONFIRMED: Sensor is in AADI Real-Time mode (XML)")
+                log("  This explains the 'Syntax error' with ASCII commands!")
+                return True, response
+            else:
+                log("\n? Not sure - no XML response received")
+                return False, response
         
     except Exception as e:
-        print(f"✗ Error: {e}")
+        log(f"✗ Error: {e}")
         return False, ""
 
 
-def switch_mode_instructions(port_name):
+def switch_mode_instructions(port_name, log=print):
     """Show how to switch from Real-Time to Terminal mode"""
-    print(f"\n{'='*70}")
-    print(f"HOW TO SWITCH {port_name} TO SMART SENSOR TERMINAL MODE")
-    print('='*70)
+    log(f"\n{'='*70}")
+    log(f"HOW TO SWITCH {port_name} TO SMART SENSOR TERMINAL MODE")
+    log('='*70)
     
-    print("""
+    log("""
 Your sensors are in AADI Real-Time mode (XML protocol).
 Our Python scripts expect Smart Sensor Terminal mode (ASCII commands).
 
@@ -72,94 +73,110 @@ I'll try to switch the sensor automatically...
 """)
 
 
-def try_auto_switch(port_name):
+def _wait_until_responsive(port_name, max_wait=10.0, base_s=0.05, max_delay=2.0):
+    """Send CRLF with jittered exponential backoff until the rebooting sensor answers; True if it did"""
+    end = time.monotonic() + max_wait
+    delay = base_s
+    while time.monotonic() < end:
+        try:
+            with serial.Serial(port_name, 9600) as ser:
+                while time.monotonic() < end:
+                    ser.write(b'\r\n')
+                    # read(1) returns on the first byte, so a live sensor is seen at once
+                    ser.timeout = min(delay, max(0.0, end - time.monotonic()))
+                    if ser.read(1):
+                        return True
+                    delay = min(max_delay, delay * 2 * random.uniform(0.75, 1.25))
+        except serial.SerialException:
+            # The port can drop out briefly while the sensor restarts
+            time.sleep(delay)
+            delay = min(max_delay, delay * 2 * random.uniform(0.75, 1.25))
+    return False
+
+
+def try_auto_switch(port_name, log=print):
     """Attempt to switch sensor to Terminal mode using XML commands"""
-    print(f"\n[ATTEMPTING AUTO-SWITCH ON {port_name}]")
+    log(f"\n[ATTEMPTING AUTO-SWITCH ON {port_name}]")
     
     try:
-        ser = serial.Serial(port_name, 9600, timeout=5)
+        with serial.Serial(port_name, 9600, timeout=5) as ser:
         
-        # Wake up
-        ser.write(b'\r\n')
-        time.sleep(0.5)
-        ser.reset_input_buffer()
+            # Wake up
+            ser.write(b'\r\n')
+            time.sleep(0.5)
+            ser.reset_input_buffer()
         
-        # Step 1: Get current mode
-        print("\n1. Checking current mode...")
-        ser.write(b'<Get><Mode/></Get>\r\n')
-        time.sleep(1.0)
+            # Step 1: Get current mode
+            log("\n1. Checking current mode...")
+            ser.write(b'<Get><Mode/></Get>\r\n')
+            time.sleep(1.0)
         
-        mode_response = ""
-        if ser.in_waiting > 0:
-            mode_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-            print(f"   Current mode response: {mode_response[:150]}")
+            mode_response = ""
+            if ser.in_waiting > 0:
+                mode_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+                log(f"   Current mode response: {mode_response[:150]}")
         
-        # Step 2: Set mode to Terminal
-        print("\n2. Setting mode to 'Smart Sensor Terminal'...")
-        ser.write(b'<Set><Mode>Smart Sensor Terminal</Mode></Set>\r\n')
-        time.sleep(1.5)
+            # Step 2: Set mode to Terminal
+            log("\n2. Setting mode to 'Smart Sensor Terminal'...")
+            ser.write(b'<Set><Mode>Smart Sensor Terminal</Mode></Set>\r\n')
+            time.sleep(1.5)
         
-        set_response = ""
-        if ser.in_waiting > 0:
-            set_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-            print(f"   Response: {set_response[:150]}")
+            set_response = ""
+            if ser.in_waiting > 0:
+                set_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+                log(f"   Response: {set_response[:150]}")
         
-        if 'Error' in set_response or 'error' in set_response:
-            print("   ✗ Error setting mode")
-            ser.close()
-            return False
+            if 'Error' in set_response or 'error' in set_response:
+                log("   ✗ Error setting mode")
+                return False
         
-        # Step 3: Save settings
-        print("\n3. Saving settings...")
-        ser.write(b'<Command>Save</Command>\r\n')
-        time.sleep(1.0)
+            # Step 3: Save settings
+            log("\n3. Saving settings...")
+            ser.write(b'<Command>Save</Command>\r\n')
+            time.sleep(1.0)
         
-        save_response = ""
-        if ser.in_waiting > 0:
-            save_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-            print(f"   Response: {save_response[:150]}")
+            save_response = ""
+            if ser.in_waiting > 0:
+                save_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+                log(f"   Response: {save_response[:150]}")
         
-        # Step 4: Reset sensor
-        print("\n4. Resetting sensor (will reboot)...")
-        ser.write(b'<Command>Reset</Command>\r\n')
-        time.sleep(0.5)
-        ser.close()
+            # Step 4: Reset sensor
+            log("\n4. Resetting sensor (will reboot)...")
+            ser.write(b'<Command>Reset</Command>\r\n')
+            time.sleep(0.5)
         
-        print("\n   ⏳ Waiting 10 seconds for sensor to reboot...")
-        time.sleep(10)
+        log("\n   ⏳ Waiting for sensor to reboot (up to 10 seconds)...")
+        if not _wait_until_responsive(port_name):
+            log("   ⚠ No answer after 10 seconds, testing anyway")
         
         # Step 5: Test if it worked
-        print("\n5. Testing if sensor is now in Terminal mode...")
-        ser = serial.Serial(port_name, 9600, timeout=3)
+        log("\n5. Testing if sensor is now in Terminal mode...")
+        with serial.Serial(port_name, 9600, timeout=3) as ser:
         
-        # Wake up
-        for _ in range(3):
-            ser.write(b'\r\n')
-            time.sleep(0.2)
-        
-        time.sleep(1.0)
-        ser.reset_input_buffer()
-        
-        # Try ASCII command
-        ser.write(b'$GET ProductName\r\n')
-        time.sleep(1.5)
+            # Wake up
+            for _ in range(3):
+                ser.write(b'\r\n')
+                time.sleep(0.2)
         
-        test_response = ""
-        if ser.in_waiting > 0:
-            test_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-            print(f"   Response: {test_response[:200]}")
+            time.sleep(1.0)
+            ser.reset_input_buffer()
         
-        ser.close()
+            # Try ASCII command; Terminal-mode replies end with the '#' prompt
+            ser.timeout = 1.5
+            ser.write(b'$GET ProductName\r\n')
+            test_response = ser.read_until(b'#', 4096).decode('ascii', errors='ignore')
+            if test_response:
+                log(f"   Response: {test_response[:200]}")
         
         if 'Syntax error' not in test_response and '=' in test_response:
-            print("\n   ✓ SUCCESS! Sensor is now in Terminal mode!")
+            log("\n   ✓ SUCCESS! Sensor is now in Terminal mode!")
             return True
         else:
-            print("\n   ✗ Still getting errors - manual switch needed")
+            log("\n   ✗ Still getting errors - manual switch needed")
             return False
         
     except Exception as e:
-        print(f"\n   ✗ Error during auto-switch: {e}")
+        log(f"\n   ✗ Error during auto-switch: {e}")
         return False
 
 
@@ -216,13 +233,13 @@ def main():
     
     ports = ['COM3', 'COM4', 'COM5']
     
+    def instructions_and_switch(port, log):
+        switch_mode_instructions(port, log)
+        return try_auto_switch(port, log)
+
     # Test each port
-    xml_confirmed = []
-    for port in ports:
-        is_xml, response = try_xml_commands(port)
-        if is_xml:
-            xml_confirmed.append(port)
-        time.sleep(0.5)
+    results = run_per_port(ports, try_xml_commands)
+    xml_confirmed = [port for port, (is_xml, _) in zip(ports, results) if is_xml]
     
     if not xml_confirmed:
         print("\n⚠️  Couldn't confirm XML mode, but let's try switching anyway...")
@@ -233,12 +250,8 @@ def main():
     print("ATTEMPTING AUTOMATIC MODE SWITCH")
     print("="*70)
     
-    success_count = 0
-    for port in xml_confirmed:
-        switch_mode_instructions(port)
-        if try_auto_switch(port):
-            success_count += 1
-        time.sleep(1)
+    # Save/Reset/reboot take many seconds, so progress is printed as it happens
+    success_count = sum(run_per_port(xml_confirmed, instructions_and_switch, live=True))
     
     # Summary
     print("\n\n" + "="*70)
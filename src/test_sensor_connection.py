@@ -3,37 +3,60 @@ Comprehensive Aanderaa Sensor Connection Test
 Tests connectivity and identifies sensor types
 """
 
+import json
 import serial
-import serial.tools.list_ports
-import time
 import sys
 import re
 
+from config_manager import infer_sensor_type
+from identify_sensors import filter_candidate_ports, is_bluetooth_port
+from serial_io import collect_until, query, run_per_port
+from serial_tuning import enlarge_rx_buffer, set_low_latency
 
-_CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
 
+# Bytes dropped from a tab frame before decoding: control chars except tab, the '!' ready
+# marker and non-ASCII line noise (CR/LF are already gone after splitlines())
+_FRAME_DROP = bytes([*range(0x00, 0x09), *range(0x0A, 0x20), ord("!"), *range(0x80, 0x100)])
 
-def _strip_control_chars(s: str) -> str:
-    # Keep tab/newline/carriage return; drop other ASCII control chars.
-    return _CONTROL_CHARS_RE.sub("", s)
+_NON_ASCII = bytes(range(0x80, 0x100))
+# Terminal-mode fallback queries, sent back to back; HELP goes last as its reply is long
+_TERMINAL_QUERIES = b"$GET ProductName\r\n$GET SerialNumber\r\n$GET Mode\r\nHELP\r\n"
+# Each reply ends with the '#' prompt
+_TERMINAL_ACKS = _TERMINAL_QUERIES.count(b"\r\n")
+# Value of each queried property in the combined Terminal-mode reply
+_KV_RES = {
+    key: re.compile(key.encode() + rb"\s*=([^=\n]*)")
+    for key in ("ProductName", "SerialNumber", "Mode")
+}
 
 
-def _extract_tab_frames(raw: str):
+def _ascii(raw: bytes) -> str:
+    # translate() drops non-ASCII line noise in one C pass, so decode needs no error handler
+    return raw.translate(None, _NON_ASCII).decode("ascii")
+
+
+def _kv_value(response: bytes, key: str) -> str:
+    # Only the matched value is decoded, not the whole reply
+    m = _KV_RES[key].search(response)
+    return _ascii(m.group(1)).strip() if m else ""
+
+
+def _extract_tab_frames(raw: bytes):
     if not raw:
         return []
-    text = _strip_control_chars(raw).replace("!", "")
     frames = []
-    for line in text.replace("\r", "\n").split("\n"):
-        if "\t" not in line:
+    # splitlines() handles CR, LF and CRLF in one pass; only tab lines get decoded
+    for line in raw.splitlines():
+        if b"\t" not in line:
             continue
-        fields = [f.strip() for f in line.split("\t") if f.strip()]
+        fields = [f.strip() for f in line.translate(None, _FRAME_DROP).decode("ascii").split("\t") if f.strip()]
         if fields:
             frames.append(fields)
     return frames
 
 
 def _pick_best_data_frame(frames):
-    best = None
+    # Detection only needs one valid frame, so stop at the first
     for fields in frames:
         if len(fields) < 2:
             continue
@@ -42,23 +65,19 @@ def _pick_best_data_frame(frames):
             continue
         product = fields[0]
         serial_no = fields[1]
-        if not re.match(r"^\d{4}.*", product):
+        # Data frames start with a 4-digit product number and a numeric serial number
+        if len(product) < 4 or not product[:4].isdigit():
             continue
-        if not re.match(r"^\d+", serial_no) and len(fields) < 3:
+        if not serial_no[:1].isdigit() and len(fields) < 3:
             continue
-        best = fields
-    return best
+        return fields
+    return None
 
 
-def _infer_sensor_type(product: str) -> str:
-    p = (product or "").upper()
-    if p.startswith("4117") or p.startswith("5217") or p.startswith("5218"):
-        return "pressure"
-    if p.startswith("4330") or p.startswith("4835") or p.startswith("4831"):
-        return "oxygen"
-    if p.startswith("5819") or p.startswith("5990"):
-        return "conductivity"
-    return "unknown"
+def _has_data_frame(buf) -> bool:
+    # Only completed lines count, so a frame still arriving is not cut short
+    end = max(buf.rfind(b"\n"), buf.rfind(b"\r"))
+    return end >= 0 and _pick_best_data_frame(_extract_tab_frames(buf[:end])) is not None
 
 
 def print_header(text):
@@ -72,7 +91,9 @@ def list_ports():
     """List all available COM ports"""
     print_header("Step 1: Scanning for COM Ports")
     
-    ports = list(serial.tools.list_ports.comports())
+    # Imported here so the start-up prompt does not wait for the enumeration backends
+    from serial.tools.list_ports import comports
+    ports = list(comports())
     
     if not ports:
         print("\n✗ NO COM PORTS FOUND!")
@@ -82,31 +103,48 @@ def list_ports():
         print("  • Cable issues")
         return []
     
+    # Opening a Bluetooth SPP port can block for many seconds and never reaches a sensor
+    bluetooth = [p.device for p in ports if is_bluetooth_port(p)]
+    if bluetooth:
+        print(f"\nSkipping Bluetooth port(s): {', '.join(bluetooth)}")
+        ports = [p for p in ports if p.device not in bluetooth]
+    
+    # A full probe costs seconds per port; when USB-serial adapters are present,
+    # skip built-in and other non-adapter ports (known adapter VIDs first)
+    candidates = filter_candidate_ports(ports)
+    skipped = [p.device for p in ports if p not in candidates]
+    if skipped:
+        print(f"\nSkipping non-adapter port(s): {', '.join(skipped)}")
+        ports = candidates
+    
     print(f"\n✓ Found {len(ports)} COM port(s):\n")
+    devices = []
     for i, port in enumerate(ports, 1):
-        print(f"{i}. {port.device}")
-        print(f"   Description: {port.description}")
-        if port.manufacturer:
-            print(f"   Manufacturer: {port.manufacturer}")
+        device, description, manufacturer = port.device, port.description, port.manufacturer
+        devices.append(device)
+        print(f"{i}. {device}")
+        print(f"   Description: {description}")
+        if manufacturer:
+            print(f"   Manufacturer: {manufacturer}")
         print()
     
-    return [p.device for p in ports]
+    return devices
 
 
-def test_single_port(port_name, verbose=True):
+def test_single_port(port_name, verbose=True, log=print):
     """Test a single COM port with Aanderaa sensor"""
     
     if verbose:
-        print(f"\n{'─'*70}")
-        print(f"Testing: {port_name}")
-        print('─'*70)
+        log(f"\n{'─'*70}")
+        log(f"Testing: {port_name}")
+        log('─'*70)
     
     # Default baudrate for Aanderaa sensors
     baudrate = 9600
     
     try:
         if verbose:
-            print(f"\n1. Opening port {port_name} at {baudrate} baud...")
+            log(f"\n1. Opening port {port_name} at {baudrate} baud...")
         
         ser = serial.Serial(
             port=port_name,
@@ -120,52 +158,44 @@ def test_single_port(port_name, verbose=True):
 
         # Enable XON/XOFF (sensor sometimes emits \x11/\x13)
         ser.xonxoff = True
+        set_low_latency(ser)
+        enlarge_rx_buffer(ser)
         
         if verbose:
-            print("   ✓ Port opened successfully")
+            log("   ✓ Port opened successfully")
         
         # Step 1: Wake up sensor (per Aanderaa documentation)
         if verbose:
-            print("\n2. Waking up sensor...")
-            print("   (Using documented wake-up protocol: carriage returns + '%' character)")
+            log("\n2. Waking up sensor...")
+            log("   (Using documented wake-up protocol: carriage returns + '%' character)")
         
+        # Nothing has been written on the fresh handle, so only stale input needs purging
         ser.reset_input_buffer()
-        ser.reset_output_buffer()
-        
-        # Method 1: Carriage returns (traditional)
-        for i in range(5):
-            ser.write(b'\r\n')
-            time.sleep(0.15)
-        
-        # Method 2: '%' character (per documentation for communication sleep)
-        ser.write(b'%')
-        time.sleep(0.3)
         
-        # Wait for communication ready indicator '!'
-        time.sleep(0.7)
+        # Carriage returns (traditional) then '%' (per documentation for
+        # communication sleep), sent as one write
+        ser.write(b'\r\n' * 5 + b'%')
         
-        # Check for any wake-up response
-        if ser.in_waiting > 0:
-            wake_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+        # Wait for the communication ready indicator '!' (or any reply), but no
+        # longer than the old fixed 0.9 s; streaming sensors may never send one
+        wake_response = collect_until(ser, bool, 0.9)
+        if wake_response:
             if verbose:
-                print(f"   ✓ Received wake-up response: {repr(wake_response[:50])}")
+                log(f"   ✓ Received wake-up response: {repr(_ascii(wake_response[:50]))}")
         else:
             if verbose:
-                print("   ℹ No immediate wake-up response (normal)")
+                log("   ℹ No immediate wake-up response (normal)")
         
         # Step 2: Prefer tab-delimited streaming mode (what your NI setup is using)
         if verbose:
-            print("\n3. Listening for tab-delimited frame (streaming mode)...")
+            log("\n3. Listening for tab-delimited frame (streaming mode)...")
 
         product_name = ""
         serial_number = ""
         mode = "unknown"
 
-        # Passively listen
-        time.sleep(1.2)
-        raw = ""
-        if ser.in_waiting > 0:
-            raw = ser.read(ser.in_waiting).decode("ascii", errors="ignore")
+        # Passively listen (stops as soon as a complete data frame is in)
+        raw = collect_until(ser, _has_data_frame, 1.2)
 
         frames = _extract_tab_frames(raw)
         data_frame = _pick_best_data_frame(frames)
@@ -173,10 +203,7 @@ def test_single_port(port_name, verbose=True):
         # If nothing yet, nudge once
         if not data_frame:
             ser.write(b"\r\n")
-            time.sleep(1.2)
-            raw2 = ""
-            if ser.in_waiting > 0:
-                raw2 = ser.read(ser.in_waiting).decode("ascii", errors="ignore")
+            raw2 = collect_until(ser, _has_data_frame, 1.2)
             frames2 = _extract_tab_frames(raw2)
             data_frame = _pick_best_data_frame(frames2)
             raw = raw + raw2
@@ -186,92 +213,66 @@ def test_single_port(port_name, verbose=True):
             product_name = data_frame[0]
             serial_number = data_frame[1]
             if verbose:
-                print(f"   ✓ Frame: {product_name} {serial_number} ...")
+                log(f"   ✓ Frame: {product_name} {serial_number} ...")
         else:
             if verbose and raw:
-                print(f"   ℹ Raw: {repr(raw[:200])}")
+                log(f"   ℹ Raw: {repr(_ascii(raw[:200]))}")
         
         # Step 3 (fallback): try Terminal-mode queries
-        help_response = ""
+        terminal_response = b""
         sensor_mode = ""
 
         if not product_name:
             if verbose:
-                print("\n4. Fallback: trying Terminal-mode commands ($GET / HELP)...")
-
-            ser.reset_input_buffer()
-            ser.write(b'$GET ProductName\r\n')
-            time.sleep(0.8)
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                if verbose:
-                    print(f"   ProductName response: {repr(response)}")
-                for line in response.split('\n'):
-                    if '=' in line:
-                        product_name = line.split('=')[1].strip()
-                        break
-
-            ser.reset_input_buffer()
-            ser.write(b'$GET SerialNumber\r\n')
-            time.sleep(0.8)
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+                log("\n4. Fallback: trying Terminal-mode commands ($GET / HELP)...")
+
+            # One pipelined write; the sensor answers in order. The read ends once every reply's
+            # '#' is in, or after the old per-command 0.8 s of silence (a rejected command sends no '#')
+            terminal_response = query(
+                ser,
+                _TERMINAL_QUERIES,
+                max_wait=0.8 * _TERMINAL_ACKS,
+                quiet=0.8,
+                until=lambda buf: buf.count(b"#") >= _TERMINAL_ACKS,
+            )
+            if terminal_response:
                 if verbose:
-                    print(f"   SerialNumber response: {repr(response)}")
-                for line in response.split('\n'):
-                    if '=' in line:
-                        serial_number = line.split('=')[1].strip()
-                        break
-
-            ser.reset_input_buffer()
-            ser.write(b'HELP\r\n')
-            time.sleep(0.8)
-            if ser.in_waiting > 0:
-                help_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                if verbose:
-                    print(f"   HELP response ({len(help_response)} chars)")
-
-            ser.reset_input_buffer()
-            ser.write(b'$GET Mode\r\n')
-            time.sleep(0.8)
-            if ser.in_waiting > 0:
-                mode_response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                for line in mode_response.split('\n'):
-                    if '=' in line:
-                        sensor_mode = line.split('=')[1].strip()
-                        break
-
-            mode = "terminal" if (product_name or help_response) else mode
+                    log(f"   Terminal response ({len(terminal_response)} bytes): {repr(terminal_response[:200])}")
+                product_name = _kv_value(terminal_response, "ProductName")
+                serial_number = _kv_value(terminal_response, "SerialNumber")
+                sensor_mode = _kv_value(terminal_response, "Mode")
+
+            mode = "terminal" if (product_name or terminal_response) else mode
         
         # Report mode hints
         if verbose and mode == "terminal" and sensor_mode:
             if 'AICAP' in sensor_mode.upper():
-                print(f"   ⚠ WARNING: Sensor is in AiCaP mode (not standalone RS-232)")
+                log(f"   ⚠ WARNING: Sensor is in AiCaP mode (not standalone RS-232)")
         
         ser.close()
         
         # Determine sensor type
-        sensor_type = _infer_sensor_type(product_name) if product_name else "unknown"
+        sensor_type = infer_sensor_type(product_name) if product_name else "unknown"
         
         # Summary
         if verbose:
-            print("\n" + "─"*70)
-            print("RESULT:")
-            print("─"*70)
+            log("\n" + "─"*70)
+            log("RESULT:")
+            log("─"*70)
         
-        success = bool(product_name or help_response)
+        success = bool(product_name or terminal_response)
         
         if success:
             if verbose:
-                print(f"✓ SENSOR DETECTED!")
+                log(f"✓ SENSOR DETECTED!")
                 if product_name:
-                    print(f"  Product: {product_name}")
+                    log(f"  Product: {product_name}")
                 if serial_number:
-                    print(f"  Serial Number: {serial_number}")
+                    log(f"  Serial Number: {serial_number}")
                 if sensor_type != "Unknown":
-                    print(f"  Type: {sensor_type}")
-                print(f"  Port: {port_name}")
-                print(f"  Baudrate: {baudrate}")
+                    log(f"  Type: {sensor_type}")
+                log(f"  Port: {port_name}")
+                log(f"  Baudrate: {baudrate}")
             
             return {
                 'success': True,
@@ -284,11 +285,11 @@ def test_single_port(port_name, verbose=True):
             }
         else:
             if verbose:
-                print("✗ No response from sensor")
-                print("\nTroubleshooting:")
-                print("  • Check sensor power (6-14V DC)")
-                print("  • Verify cable connections")
-                print("  • Ensure sensor is in Smart Sensor Terminal mode")
+                log("✗ No response from sensor")
+                log("\nTroubleshooting:")
+                log("  • Check sensor power (6-14V DC)")
+                log("  • Verify cable connections")
+                log("  • Ensure sensor is in Smart Sensor Terminal mode")
             
             return {
                 'success': False,
@@ -298,12 +299,12 @@ def test_single_port(port_name, verbose=True):
         
     except serial.SerialException as e:
         if verbose:
-            print(f"\n✗ Serial port error: {e}")
+            log(f"\n✗ Serial port error: {e}")
         return {'success': False, 'port': port_name, 'error': str(e)}
     
     except Exception as e:
         if verbose:
-            print(f"\n✗ Unexpected error: {e}")
+            log(f"\n✗ Unexpected error: {e}")
         return {'success': False, 'port': port_name, 'error': str(e)}
 
 
@@ -311,14 +312,7 @@ def test_all_ports(ports):
     """Test all available ports"""
     print_header("Step 2: Testing Each Port for Aanderaa Sensors")
     
-    results = []
-    
-    for port in ports:
-        result = test_single_port(port, verbose=True)
-        results.append(result)
-        time.sleep(0.5)
-    
-    return results
+    return run_per_port(ports, lambda port, log: test_single_port(port, verbose=True, log=log), max_workers=8)
 
 
 def generate_config(results):
@@ -357,32 +351,21 @@ def generate_config(results):
     print("\n" + "─"*70)
     print("Suggested sensor_config.json:")
     print("─"*70)
-    print("\n{")
-    print('  "sensors": [')
-    
-    for i, sensor in enumerate(detected):
+    sensors = []
+    for sensor in detected:
         name = sensor.get('product_name', 'Aanderaa Sensor')
         if sensor.get('serial_number'):
             name += f" SN {sensor['serial_number']}"
         
-        sensor_type = "unknown"
-        if '4117' in sensor.get('product_name', '').upper():
-            sensor_type = "pressure"
-        elif '4330' in sensor.get('product_name', '').upper():
-            sensor_type = "oxygen"
-        elif '5819' in sensor.get('product_name', '').upper() or '5990' in sensor.get('product_name', '').upper():
-            sensor_type = "conductivity"
-        
-        print('    {')
-        print(f'      "name": "{name}",')
-        print(f'      "com_port": "{sensor["port"]}",')
-        print(f'      "baudrate": {sensor["baudrate"]},')
-        print(f'      "sensor_type": "{sensor_type}",')
-        print('      "timeout": 2')
-        print('    }' + (',' if i < len(detected) - 1 else ''))
+        sensors.append({
+            "name": name,
+            "com_port": sensor["port"],
+            "baudrate": sensor["baudrate"],
+            "sensor_type": infer_sensor_type(sensor.get('product_name', '')),
+            "timeout": 2
+        })
     
-    print('  ]')
-    print('}')
+    print("\n" + json.dumps({"sensors": sensors}, indent=2))
 
 
 def main():
@@ -5,11 +5,20 @@ Based on NI-VISA configuration
 import serial
 import time
 
-def test_scpi_commands(port_name):
+from serial_io import query, run_per_port
+from serial_tuning import enlarge_rx_buffer, set_low_latency
+
+
+def _ask(ser, command):
+    """Send a test command and return the decoded reply (empty if the sensor stays silent)"""
+    return query(ser, command, max_wait=2.0, quiet=0.3).decode('ascii', errors='ignore')
+
+
+def test_scpi_commands(port_name, log=print):
     """Test sensor with SCPI standard commands"""
-    print(f"\n{'='*70}")
-    print(f"Testing {port_name} with SCPI Commands")
-    print('='*70)
+    log(f"\n{'='*70}")
+    log(f"Testing {port_name} with SCPI Commands")
+    log('='*70)
     
     try:
         # Exact settings from user's VISA configuration
@@ -24,10 +33,12 @@ def test_scpi_commands(port_name):
             rtscts=False,
             dsrdtr=False
         )
+        set_low_latency(ser)
+        enlarge_rx_buffer(ser)
         
-        print(f"✓ Port opened with VISA settings")
-        print(f"  Baudrate: 9600, Data bits: 8, Parity: None")
-        print(f"  Stop bits: 1, Flow control: None\n")
+        log(f"✓ Port opened with VISA settings")
+        log(f"  Baudrate: 9600, Data bits: 8, Parity: None")
+        log(f"  Stop bits: 1, Flow control: None\n")
         
         # Clear buffers
         ser.reset_input_buffer()
@@ -35,132 +46,67 @@ def test_scpi_commands(port_name):
         time.sleep(0.1)
         
         # Test 1: *IDN? command (SCPI standard identification)
-        print("[Test 1] Sending: *IDN?")
-        ser.write(b'*IDN?\r\n')
-        time.sleep(1.0)
-        
-        response1 = ""
-        attempts = 0
-        while attempts < 5:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                response1 += chunk
-                time.sleep(0.2)
-            else:
-                if response1:
-                    break
-                time.sleep(0.2)
-            attempts += 1
+        log("[Test 1] Sending: *IDN?")
+        response1 = _ask(ser, b'*IDN?\r\n')
         
-        print(f"Response ({len(response1)} bytes): {repr(response1)}")
+        log(f"Response ({len(response1)} bytes): {repr(response1)}")
         
         if response1:
-            print(f"✓ Sensor responded to *IDN?")
-            print(f"\nParsed response:")
+            log(f"✓ Sensor responded to *IDN?")
+            log(f"\nParsed response:")
             for line in response1.split('\n'):
                 if line.strip():
-                    print(f"  {line.strip()}")
+                    log(f"  {line.strip()}")
         else:
-            print("✗ No response to *IDN?")
+            log("✗ No response to *IDN?")
         
         # Test 2: Try to get product info with different formats
-        print(f"\n[Test 2] Trying Aanderaa ASCII command: $GET ProductName")
-        ser.reset_input_buffer()
+        log(f"\n[Test 2] Trying Aanderaa ASCII command: $GET ProductName")
         time.sleep(0.3)
-        ser.write(b'$GET ProductName\r\n')
-        time.sleep(1.0)
-        
-        response2 = ""
-        attempts = 0
-        while attempts < 5:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                response2 += chunk
-                time.sleep(0.2)
-            else:
-                if response2:
-                    break
-                time.sleep(0.2)
-            attempts += 1
+        response2 = _ask(ser, b'$GET ProductName\r\n')
         
-        print(f"Response: {repr(response2[:200])}")
+        log(f"Response: {repr(response2[:200])}")
         
         # Test 3: Try Aanderaa XML command
-        print(f"\n[Test 3] Trying Aanderaa XML command: <Get><ProductName/></Get>")
-        ser.reset_input_buffer()
+        log(f"\n[Test 3] Trying Aanderaa XML command: <Get><ProductName/></Get>")
         time.sleep(0.3)
-        ser.write(b'<Get><ProductName/></Get>\r\n')
-        time.sleep(1.0)
-        
-        response3 = ""
-        attempts = 0
-        while attempts < 5:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                response3 += chunk
-                time.sleep(0.2)
-            else:
-                if response3:
-                    break
-                time.sleep(0.2)
-            attempts += 1
+        response3 = _ask(ser, b'<Get><ProductName/></Get>\r\n')
         
-        print(f"Response: {repr(response3[:200])}")
+        log(f"Response: {repr(response3[:200])}")
         
         # Test 4: Try simple query format
-        print(f"\n[Test 4] Trying simple query: ProductName?")
-        ser.reset_input_buffer()
+        log(f"\n[Test 4] Trying simple query: ProductName?")
         time.sleep(0.3)
-        ser.write(b'ProductName?\r\n')
-        time.sleep(1.0)
-        
-        response4 = ""
-        attempts = 0
-        while attempts < 5:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                response4 += chunk
-                time.sleep(0.2)
-            else:
-                if response4:
-                    break
-                time.sleep(0.2)
-            attempts += 1
+        response4 = _ask(ser, b'ProductName?\r\n')
         
-        print(f"Response: {repr(response4[:200])}")
+        log(f"Response: {repr(response4[:200])}")
         
         # Test 5: Other SCPI commands
-        print(f"\n[Test 5] Trying: *RST (Reset)")
-        ser.reset_input_buffer()
+        log(f"\n[Test 5] Trying: *RST (Reset)")
         time.sleep(0.3)
-        ser.write(b'*RST\r\n')
-        time.sleep(1.0)
-        
-        response5 = ""
-        if ser.in_waiting > 0:
-            response5 = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-        print(f"Response: {repr(response5[:200])}")
+        response5 = _ask(ser, b'*RST\r\n')
+        log(f"Response: {repr(response5[:200])}")
         
         ser.close()
         
         # Analysis
-        print(f"\n{'-'*70}")
-        print("ANALYSIS:")
-        print('-'*70)
+        log(f"\n{'-'*70}")
+        log("ANALYSIS:")
+        log('-'*70)
         
         if response1:
-            print("✓ Sensor responds to SCPI *IDN? command")
-            print("  → Sensor is using SCPI/VISA protocol")
+            log("✓ Sensor responds to SCPI *IDN? command")
+            log("  → Sensor is using SCPI/VISA protocol")
         
         if 'Syntax error' in response2:
-            print("✗ Aanderaa ASCII commands not working (Syntax error)")
+            log("✗ Aanderaa ASCII commands not working (Syntax error)")
         elif response2 and '=' in response2:
-            print("✓ Aanderaa ASCII commands working")
+            log("✓ Aanderaa ASCII commands working")
         
         if response3 and '<Result>' in response3:
-            print("✓ Aanderaa XML commands working")
+            log("✓ Aanderaa XML commands working")
         elif 'Syntax error' in response3:
-            print("✗ Aanderaa XML commands not working")
+            log("✗ Aanderaa XML commands not working")
         
         return {
             'port': port_name,
@@ -171,7 +117,7 @@ def test_scpi_commands(port_name):
         }
         
     except Exception as e:
-        print(f"✗ Error: {e}")
+        log(f"✗ Error: {e}")
         return {'port': port_name, 'error': str(e)}
 
 
@@ -184,11 +130,7 @@ def main():
     
     ports = ['COM12', 'COM13', 'COM14']
     
-    results = []
-    for port in ports:
-        result = test_scpi_commands(port)
-        results.append(result)
-        time.sleep(1)
+    results = run_per_port(ports, test_scpi_commands)
     
     # Summary
     print("\n\n" + "="*70)